@@ -0,0 +1,51 @@
+""" Runs the page watchers described by a configuration file.
+    Usage: python -m http_page_monitor config.json """
+from threading import Event
+import argparse
+import logging
+import sys
+from .config import load_config, build_manager
+
+
+def main(argv=None):
+    """ Parse the arguments, build the watchers and
+        run them until interrupted """
+    parser = argparse.ArgumentParser(
+        prog="python -m http_page_monitor",
+        description="Watch web pages for changes.")
+    parser.add_argument("config",
+                        help="a JSON, TOML or YAML file describing "
+                             "the pages to watch")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="the logging level (default: WARNING)")
+    parser.add_argument("--check", action="store_true",
+                        help="only check that the configuration is valid")
+    args = parser.parse_args(argv)
+
+    # Level names are mapped to numbers, unknown names to strings
+    if not isinstance(logging.getLevelName(args.log_level.upper()), int):
+        parser.error("unknown log level: " + args.log_level)
+    logging.basicConfig(level=args.log_level.upper())
+
+    try:
+        manager = build_manager(load_config(args.config))
+    except (OSError, ValueError, ImportError) as err:
+        parser.exit(1, "{}: {}\n".format(parser.prog, err))
+
+    if args.check:
+        print("{} watchers configured".format(len(manager.watchers)))
+        return 0
+
+    manager.start()
+    try:
+        # Sleep until interrupted, the watchers do the work
+        Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
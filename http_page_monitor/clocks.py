@@ -0,0 +1,45 @@
+""" Clocks that PageWatchers use to tell the time and to wait """
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    """ Tells the real time and really waits """
+    def now(self):
+        """ Returns the current time """
+        return datetime.now()
+
+    def wait(self, event, timeout):
+        """ Waits until the event is set or the timeout passes.
+            Returns True if the event was set """
+        return event.wait(timeout=timeout)
+
+
+class VirtualClock:
+    """ A clock that only moves when it is told to.  Waiting on
+        it moves the clock forward and returns right away """
+    def __init__(self, start=None):
+        # Start at a fixed time so simulations are repeatable
+        if start is None:
+            start = datetime(2000, 1, 1)
+        self.current_time = start
+
+    def now(self):
+        """ Returns the current time of this clock """
+        return self.current_time
+
+    def advance(self, seconds):
+        """ Move the clock forward by some seconds """
+        self.current_time += timedelta(seconds=seconds)
+
+    def advance_to(self, time):
+        """ Move the clock forward to a time.
+            The clock never moves backwards """
+        if time > self.current_time:
+            self.current_time = time
+
+    def wait(self, event, timeout):
+        """ Moves the clock forward by the timeout unless the
+            event is already set.  Returns True if the event was set """
+        if not event.is_set():
+            self.advance(timeout)
+        return event.is_set()
@@ -1,6 +1,56 @@
 """ Functions that generate comparitor functions that
-    can be then used to compare the HTML of two pages"""
-from bs4 import BeautifulSoup
+    can be then used to compare the HTML of two pages.
+    BeautifulSoup is only imported once a page is parsed
+    so that importing this module stays cheap """
+from array import array
+from hashlib import blake2b
+from collections import namedtuple, Counter
+from itertools import chain
+from threading import Lock
+from zlib import crc32
+import sys
+from .diffs import diff_lines, bounded_join
+from .tracing import traced
+
+
+# A node of a tag hash tree.  The digest covers the name, attributes
+# and the digests of the children so equal digests mean equal subtrees
+HashNode = namedtuple("HashNode", "digest name attributes children")
+
+
+class LastPageCache:
+    """ Remembers values worked out from the pages a comparison function
+        was last given as its new page.  Each of those pages is the old
+        page of the next comparison made by the same watcher so its
+        value doesn't have to be worked out again.  The values are kept
+        by page so a comparison function can be shared by up to
+        max_pages watchers, the oldest value is forgotten after that """
+    def __init__(self, max_pages=64):
+        self.max_pages = max_pages
+        # Maps the hashes of pages to their values, oldest first
+        self.values = {}
+        self.lock = Lock()
+
+    def get(self, html, compute):
+        """ Returns the value remembered for a page,
+            or computes it if it wasn't remembered """
+        page_hash = hash(html)
+        with self.lock:
+            if page_hash in self.values:
+                return self.values[page_hash]
+        return compute(html)
+
+    def remember(self, html, value, replaces=None):
+        """ Remember the value of a page.  The value of the page it
+            replaces, the old page of the comparison, is forgotten """
+        with self.lock:
+            if replaces is not None:
+                self.values.pop(hash(replaces), None)
+            page_hash = hash(html)
+            self.values.pop(page_hash, None)
+            self.values[page_hash] = value
+            while len(self.values) > self.max_pages:
+                del self.values[next(iter(self.values))]
 
 
 def remove_whitespace(string):
@@ -26,102 +76,361 @@ def remove_attributes_from_soup(soup):
         tag.attrs.clear()
 
 
-def html_text_comparison(selector=None, case_sensitive=True,
-                         ignore_whitespace=False,
-                         strip_strings=True):
-
-    """ This comparison function generator checks if
-        the text of the selected elements have changed"""
-    def generated_comparitor(old_html, new_html):
-        old_soup = BeautifulSoup(old_html, features="html.parser")
-        new_soup = BeautifulSoup(new_html, features="html.parser")
-        if selector:
-            old_soup = old_soup.select(selector)
-            new_soup = new_soup.select(selector)
-
-            old_text = [element.get_text() for element in old_soup]
-            new_text = [element.get_text() for element in new_soup]
+# BIT_COUNT_TABLES[bit] translates each byte to 1 if that bit is set
+# in it and to 0 otherwise so counting the 1s counts the set bits
+BIT_COUNT_TABLES = [bytes((value >> bit) & 1 for value in range(256))
+                    for bit in range(8)]
+
+
+def shingle_hashes(text, shingle_size=3):
+    """ returns the 64 bit hashes of the overlapping word shingles of a
+        string as an array.  text shorter than a single shingle is one
+        shingle.  each word is hashed with crc32 and each shingle is
+        hashed as the tuple of its word hashes.  unlike hashing strings
+        neither of these change between runs """
+    word_hashes = list(map(crc32, map(str.encode, text.split())))
+    if not word_hashes:
+        return array("q")
+    if len(word_hashes) < shingle_size:
+        return array("q", [hash(tuple(word_hashes))])
+    return array("q", map(hash, zip(*(word_hashes[offset:]
+                                      for offset in range(shingle_size)))))
+
+
+def simhash(hashes):
+    """ computes the 64 bit SimHash fingerprint of an iterable of 64 bit
+        hashes.  similar inputs produce fingerprints with a small
+        hamming distance between them """
+    digests = array("q", hashes)
+    if digests.itemsize != 8:
+        raise ValueError("SimHash needs 64 bit hashes")
+    digest_count = len(digests)
+    digests = digests.tobytes()
+
+    # Every bit is counted across all of the hashes at once by taking
+    # the column of bytes at each offset of the hashes and counting
+    # the set bits in the column, rather than looping over every bit
+    # of every hash
+    fingerprint = 0
+    for offset in range(8):
+        column = digests[offset::8]
+        if sys.byteorder == "little":
+            shift = offset * 8
         else:
-            old_text = [old_soup.get_text()]
-            new_text = [new_soup.get_text()]
-
-        if strip_strings:
-            old_text = \
-                [text.strip() for text in old_text]
-            new_text = \
-                [text.strip() for text in new_text]
-
-        compare_old_text = old_text[:]
-        compare_new_text = new_text[:]
-
-        if not case_sensitive:
-            compare_old_text = map(str.lower, compare_old_text)
-            compare_new_text = map(str.lower, compare_new_text)
-
-        if ignore_whitespace:
-            # Remove all the white space
-            compare_old_text = \
-                [remove_whitespace(text) for text in compare_old_text]
-            compare_new_text = \
-                [remove_whitespace(text) for text in compare_new_text]
-
-        if len(old_text) != len(new_text):
-            return "Number of selected elements"\
-                   " is different from the last request:\n" +\
-                   "\n".join(new_text)
-
+            shift = (7 - offset) * 8
+        for bit, table in enumerate(BIT_COUNT_TABLES):
+            if column.translate(table).count(1) * 2 > digest_count:
+                fingerprint |= 1 << (shift + bit)
+    return fingerprint
+
+
+def fingerprint_similarity(old_fingerprint, new_fingerprint, bits=64):
+    """ estimates the similarity of two SimHash fingerprints
+        as a number between 0 and 1 """
+    distance = bin(old_fingerprint ^ new_fingerprint).count("1")
+    return 1 - distance / bits
+
+
+def attribute_items(tag):
+    """ returns the attributes of a tag as a tuple of
+        (name, value) pairs with multi-valued attributes joined """
+    return tuple((name, " ".join(value) if isinstance(value, list) else value)
+                 for name, value in tag.attrs.items())
+
+
+def tag_hash_tree(element, ignore_attributes=False):
+    """ builds a tree of HashNodes for a soup element and its
+        descendent tags.  text is not part of the tree """
+    from bs4.element import Tag
+
+    children = tuple(tag_hash_tree(child, ignore_attributes)
+                     for child in element.children
+                     if isinstance(child, Tag))
+    attributes = () if ignore_attributes else attribute_items(element)
+
+    digest = blake2b(digest_size=16)
+    digest.update(element.name.encode("utf-8") + b"\0")
+    for name, value in attributes:
+        digest.update(name.encode("utf-8") + b"=" +
+                      str(value).encode("utf-8") + b"\0")
+    for child in children:
+        digest.update(child.digest)
+
+    return HashNode(digest.digest(), element.name, attributes, children)
+
+
+def path_segments(names):
+    """ returns the path segment of each sibling in a list of tag names.
+        siblings that share a name are numbered starting from 1 """
+    totals = Counter(names)
+    seen = Counter()
+    segments = []
+    for name in names:
+        seen[name] += 1
+        if totals[name] > 1:
+            segments.append("/{}[{}]".format(name, seen[name]))
+        else:
+            segments.append("/" + name)
+    return segments
+
+
+def element_path(element, sibling_segments=None):
+    """ returns the path of a soup element from the root of its
+        document such as /html/body/ol/li[2].  the path segments of
+        the children of each parent are worked out once and kept in
+        sibling_segments, so passing the same dictionary when finding
+        the paths of many elements in a document keeps it linear """
+    from bs4.element import Tag
+
+    if sibling_segments is None:
+        sibling_segments = {}
+
+    path = ""
+    while element.parent is not None:
+        parent = element.parent
+        # Maps the ids of the parent's children to their segments
+        segments = sibling_segments.get(id(parent))
+        if segments is None:
+            siblings = [sibling for sibling in parent.children
+                        if isinstance(sibling, Tag)]
+            segments = dict(zip(
+                map(id, siblings),
+                path_segments([sibling.name for sibling in siblings])))
+            sibling_segments[id(parent)] = segments
+        path = segments[id(element)] + path
+        element = parent
+    return path
+
+
+def format_attributes(attributes):
+    """ formats attribute pairs the way they appear in a tag """
+    return " ".join('{}="{}"'.format(name, value)
+                    for name, value in attributes)
+
+
+def diff_hash_trees(old_tree, new_tree, path="", differences=None):
+    """ returns a description of each node that differs between two
+        hash trees.  subtrees with equal digests are not walked """
+    if differences is None:
         differences = []
-        zip_comparison = zip(compare_old_text, compare_new_text,
-                             old_text,         new_text)
 
-        for old_compare, new_compare, old, new in zip_comparison:
-            if old_compare != new_compare:
-                differences.append("'{}' -> '{}'".format(old, new))
-
-        if differences:
-            return "Text differences found:\n" + "\n".join(differences)
-
-        # Return None if no differences could be found
+    if old_tree.digest == new_tree.digest:
+        return differences
+
+    if old_tree.name != new_tree.name:
+        differences.append("{}: <{}> -> <{}>".format(
+            path or "/", old_tree.name, new_tree.name))
+        return differences
+
+    if old_tree.attributes != new_tree.attributes:
+        differences.append("{}: attributes '{}' -> '{}'".format(
+            path or "/", format_attributes(old_tree.attributes),
+            format_attributes(new_tree.attributes)))
+
+    old_children = old_tree.children
+    new_children = new_tree.children
+    old_segments = path_segments([child.name for child in old_children])
+    new_segments = path_segments([child.name for child in new_children])
+
+    # Skip the children that are the same at the start and end so an
+    # inserted or removed child doesn't shift every sibling after it
+    start = 0
+    while start < min(len(old_children), len(new_children)) and \
+            old_children[start].digest == new_children[start].digest:
+        start += 1
+    old_end = len(old_children)
+    new_end = len(new_children)
+    while old_end > start and new_end > start and \
+            old_children[old_end - 1].digest == \
+            new_children[new_end - 1].digest:
+        old_end -= 1
+        new_end -= 1
+
+    changed = min(old_end, new_end) - start
+    for index in range(start, start + changed):
+        diff_hash_trees(old_children[index], new_children[index],
+                        path + new_segments[index], differences)
+    for index in range(start + changed, old_end):
+        differences.append("{}: removed".format(path + old_segments[index]))
+    for index in range(start + changed, new_end):
+        differences.append("{}: added".format(path + new_segments[index]))
+
+    return differences
+
+
+def selected_text(soup, selector):
+    """ returns the text of each element of a soup matching the
+        selector, or the text of the whole soup without a selector """
+    if selector:
+        return [element.get_text() for element in soup.select(selector)]
+    return [soup.get_text()]
+
+
+def comparable_text(texts, case_sensitive, ignore_whitespace):
+    """ returns the texts in the form they are compared in """
+    if not case_sensitive:
+        texts = [text.lower() for text in texts]
+    if ignore_whitespace:
+        # Remove all the white space
+        texts = [remove_whitespace(text) for text in texts]
+    return texts
+
+
+def text_report(old_text, new_text, compare_old_text, compare_new_text):
+    """ returns a report of the whole text of each changed element,
+        or None if none of the compared texts changed """
+    if len(old_text) != len(new_text):
+        return "Number of selected elements"\
+               " is different from the last request:\n" +\
+               "\n".join(new_text)
+
+    differences = ["'{}' -> '{}'".format(old, new)
+                   for old_compare, new_compare, old, new
+                   in zip(compare_old_text, compare_new_text,
+                          old_text, new_text)
+                   if old_compare != new_compare]
+    if differences:
+        return "Text differences found:\n" + "\n".join(differences)
+
+    # Return None if no differences could be found
+    return None
+
+
+def element_diff_lines(old_text, new_text, compare_old_text,
+                       compare_new_text, granularity, context):
+    """ yields the lines of the diffs of the changed elements.
+        elements whose diff has no edits, like a change to the
+        whitespace between words, are skipped """
+    for index, (old_compare, new_compare, old, new) in \
+            enumerate(zip(compare_old_text, compare_new_text,
+                          old_text, new_text)):
+        if old_compare == new_compare:
+            continue
+        lines = diff_lines(old, new, granularity, context)
+        if lines is not None:
+            yield "Element {}:".format(index + 1)
+            yield from lines
+
+
+def text_diff_report(old_text, new_text, compare_old_text, compare_new_text,
+                     granularity, context, max_length):
+    """ returns a report of the diffs of the changed elements of no
+        more than max_length characters, or None if none of the
+        compared texts changed """
+    if len(old_text) != len(new_text):
+        lines = diff_lines("\n".join(old_text), "\n".join(new_text),
+                           granularity, context)
+        return bounded_join(chain(["Number of selected elements"
+                                   " is different from the last request:"],
+                                  lines or []),
+                            max_length)
+
+    # Diffs are only worked out as the report is filled so
+    # nothing past max_length is diffed
+    lines = element_diff_lines(old_text, new_text, compare_old_text,
+                               compare_new_text, granularity, context)
+    first_line = next(lines, None)
+    if first_line is None:
         return None
+    return bounded_join(chain(["Text differences found:", first_line], lines),
+                        max_length)
 
-    return generated_comparitor
 
+def html_text_comparison(selector=None, case_sensitive=True,
+                         ignore_whitespace=False,
+                         strip_strings=True,
+                         diff_granularity=None,
+                         diff_context=3,
+                         max_report_length=4096,
+                         trace_function=None):
 
-def html_tag_comparison(selector=None, ignore_attributes=False):
     """ This comparison function generator checks if
-        the HTML of the selected elements have changed"""
+        the text of the selected elements have changed.
+        Setting diff_granularity to "line" or "word" reports a diff
+        of each changed element with diff_context unchanged lines or
+        words around each change instead of the whole text, and cuts
+        the report off at max_report_length characters.
+        The trace function is called with the parse, select and diff
+        phases of each comparison like the trace function of a
+        PageWatcher, with a url of None """
+    if diff_granularity not in (None, "line", "word"):
+        raise ValueError("Unknown diff granularity: " + str(diff_granularity))
+
     def generated_comparitor(old_html, new_html):
-        old_soup = BeautifulSoup(old_html, features="html.parser")
-        new_soup = BeautifulSoup(new_html, features="html.parser")
-        if selector:
-            old_html = old_soup.select(selector)
-            new_html = new_soup.select(selector)
-        else:
-            old_html = [old_soup]
-            new_html = [new_soup]
+        from bs4 import BeautifulSoup
+
+        with traced(trace_function, None, "parse"):
+            old_soup = BeautifulSoup(old_html, features="html.parser")
+            new_soup = BeautifulSoup(new_html, features="html.parser")
+        with traced(trace_function, None, "select"):
+            old_text = selected_text(old_soup, selector)
+            new_text = selected_text(new_soup, selector)
+
+        with traced(trace_function, None, "diff"):
+            if strip_strings:
+                old_text = [text.strip() for text in old_text]
+                new_text = [text.strip() for text in new_text]
+
+            compare_old_text = comparable_text(old_text, case_sensitive,
+                                               ignore_whitespace)
+            compare_new_text = comparable_text(new_text, case_sensitive,
+                                               ignore_whitespace)
+
+            if diff_granularity:
+                return text_diff_report(old_text, new_text,
+                                        compare_old_text, compare_new_text,
+                                        diff_granularity, diff_context,
+                                        max_report_length)
+            return text_report(old_text, new_text,
+                               compare_old_text, compare_new_text)
+
+    return generated_comparitor
 
-        for element in old_html:
-            remove_text_from_soup(element)
-        for element in new_html:
-            remove_text_from_soup(element)
 
-        if ignore_attributes:
-            for element in old_html:
-                remove_attributes_from_soup(element)
-            for element in new_html:
-                remove_attributes_from_soup(element)
+def html_tag_comparison(selector=None, ignore_attributes=False,
+                        trace_function=None):
+    """ This comparison function generator checks if
+        the HTML of the selected elements have changed.
+        The hash trees of the last page compared are kept so only
+        the new page has to be hashed and only the subtrees with
+        different hashes are walked, so the generated function keeps
+        state between calls.  It can be shared by up to 64 watchers,
+        after that the old pages are hashed again.  The trace function
+        is called with the parse, select and diff phases with a url of
+        None """
+    last_trees = LastPageCache()
+
+    def hash_trees(html):
+        from bs4 import BeautifulSoup
+
+        with traced(trace_function, None, "parse"):
+            soup = BeautifulSoup(html, features="html.parser")
+        with traced(trace_function, None, "select"):
+            if selector:
+                elements = soup.select(selector)
+            else:
+                elements = [soup]
+            sibling_segments = {}
+            return [(element_path(element, sibling_segments),
+                     tag_hash_tree(element, ignore_attributes))
+                    for element in elements]
+
+    def generated_comparitor(old_html, new_html):
+        old_trees = last_trees.get(old_html, hash_trees)
+        new_trees = hash_trees(new_html)
+        last_trees.remember(new_html, new_trees, replaces=old_html)
 
-        if len(old_html) != len(new_html):
+        if len(old_trees) != len(new_trees):
             return "Number of selected elements"\
                     " is different from the last request.\nNew Elements:\n" +\
-                    "\n".join([str(html) for html in new_html])
+                    "\n".join([path or "/" for path, _ in new_trees])
 
         differences = []
-        zip_comparison = zip(old_html, new_html)
+        zip_comparison = zip(old_trees, new_trees)
 
-        for old, new in zip_comparison:
-            if str(old) != str(new):
-                differences.append("'{}' -> '{}'".format(old, new))
+        with traced(trace_function, None, "diff"):
+            for (_, old), (path, new) in zip_comparison:
+                differences.extend(diff_hash_trees(old, new, path))
 
         if differences:
             return "HTML differences found:\n" + "\n".join(differences)
@@ -130,3 +439,64 @@ def html_tag_comparison(selector=None, ignore_attributes=False):
         return None
 
     return generated_comparitor
+
+
+def html_fingerprint_comparison(selector=None, threshold=0.9,
+                                shingle_size=3, case_sensitive=True,
+                                trace_function=None):
+    """ This comparison function generator estimates how similar the
+        text of the selected elements is using a SimHash fingerprint
+        and only reports a change when the similarity drops below the
+        threshold.  Each page is compared to a reference fingerprint
+        which is only replaced when a change is reported, so a page
+        that changes a little on every check is still reported once
+        the changes add up.  The reference is kept with the last page
+        so the old page does not have to be parsed again.  References
+        are kept for each page, so the generated function can be shared
+        by up to 64 watchers as long as they aren't watching the same
+        page.  The trace
+        function is called with the parse, select and diff phases with
+        a url of None, hashing the text is part of the diff """
+    reference_fingerprint = LastPageCache()
+
+    def fingerprint(html):
+        from bs4 import BeautifulSoup
+
+        with traced(trace_function, None, "parse"):
+            soup = BeautifulSoup(html, features="html.parser")
+        with traced(trace_function, None, "select"):
+            if selector:
+                elements = soup.select(selector)
+            else:
+                elements = [soup]
+            texts = [element.get_text(" ") for element in elements]
+
+        with traced(trace_function, None, "diff"):
+            hashes = array("q")
+            for text in texts:
+                if not case_sensitive:
+                    text = text.lower()
+                hashes.extend(shingle_hashes(text, shingle_size))
+
+            return simhash(hashes)
+
+    def generated_comparitor(old_html, new_html):
+        old_fingerprint = reference_fingerprint.get(old_html, fingerprint)
+        new_fingerprint = fingerprint(new_html)
+
+        similarity = fingerprint_similarity(old_fingerprint, new_fingerprint)
+        if similarity < threshold:
+            # The reported page is the reference for the next changes
+            reference_fingerprint.remember(new_html, new_fingerprint,
+                                           replaces=old_html)
+            return "Page similarity of {:.2f} is below the threshold"\
+                   " of {:.2f}".format(similarity, threshold)
+
+        # Keep comparing to the reference until a change is reported
+        reference_fingerprint.remember(new_html, old_fingerprint,
+                                       replaces=old_html)
+
+        # Return None if the pages are similar enough
+        return None
+
+    return generated_comparitor
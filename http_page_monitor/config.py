@@ -0,0 +1,239 @@
+""" Builds a WatcherManager from a JSON, TOML or YAML configuration
+    file.  A configuration looks like this in JSON:
+
+    {
+        "alert": {"type": "file", "path": "alerts.log"},
+        "watchers": [
+            {
+                "url": "https://example.com",
+                "interval": 60,
+                "comparator": {"type": "text", "selector": "h1"}
+            },
+            {
+                "url": "https://example.com/large-download.zip",
+                "probe": "head"
+            }
+        ]
+    }
+
+    The comparator type is one of "bytes", "text", "tag" or
+    "fingerprint" and the rest of its options are given to the
+    matching comparison function generator.  The alert type is one of
+    "log", "print" or "file".  An optional "transport" of
+    {"type": "http2"} shares an HTTP2Transport between all the
+    watchers, its other options are given to the HTTP2Transport.
+    Unknown options and options of the wrong type are reported as a
+    ValueError when the watchers are built, so they are found by
+    --check rather than when a page is first compared.
+    The parsers for TOML and YAML are only imported when a file of
+    that type is loaded """
+import json
+import logging
+import os
+from . import comparators
+from .watchers import PageWatcher, WatcherManager, DEFAULT_PROBE_HEADERS
+from .transports import HTTP2Transport
+
+# Maps comparator types to the comparison function generators
+COMPARATORS = {
+    "text": comparators.html_text_comparison,
+    "tag": comparators.html_tag_comparison,
+    "fingerprint": comparators.html_fingerprint_comparison,
+}
+
+# The options that can be given to each part of a configuration,
+# mapped to the types their values can have
+NUMBER = (int, float)
+COMPARATOR_OPTIONS = {
+    "bytes": {},
+    "text": {"selector": (str, type(None)), "case_sensitive": (bool,),
+             "ignore_whitespace": (bool,), "strip_strings": (bool,),
+             "diff_granularity": (str, type(None)), "diff_context": (int,),
+             "max_report_length": (int,)},
+    "tag": {"selector": (str, type(None)), "ignore_attributes": (bool,)},
+    "fingerprint": {"selector": (str, type(None)), "threshold": NUMBER,
+                    "shingle_size": (int,), "case_sensitive": (bool,)},
+}
+ALERT_OPTIONS = {
+    "log": {},
+    "print": {},
+    "file": {"path": (str,)},
+}
+TRANSPORT_OPTIONS = {
+    "requests": {},
+    "http2": {"max_streams": (int,), "http1_connections": (int,),
+              "prior_knowledge": (bool,), "timeout": NUMBER,
+              "verify": (bool,)},
+}
+WATCHER_OPTIONS = {
+    "url": (str,), "interval": NUMBER, "comparator": (dict, type(None)),
+    "ignore_errors": (bool,), "probe": (str, type(None)),
+    "probe_headers": (list, tuple),
+}
+
+
+def check_options(options, option_types, part):
+    """ Raises a ValueError naming the first option that isn't one of
+        the option types or whose value has the wrong type.  A bool
+        isn't taken as a number even though it is an int """
+    for name, value in options.items():
+        if name not in option_types:
+            raise ValueError("Unknown option for {}: {}".format(part, name))
+        types = option_types[name]
+        if isinstance(value, bool) != (bool in types) or \
+                not isinstance(value, types):
+            raise ValueError("The {} option of {} should be {}, not {!r}"
+                             .format(name, part,
+                                     " or ".join(kind.__name__
+                                                 for kind in types),
+                                     value))
+
+
+def load_config(path):
+    """ Reads a configuration file, the format is
+        picked from the extension of the file """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".json":
+        with open(path, encoding="utf-8") as config_file:
+            return json.load(config_file)
+
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError("Reading TOML files needs Python 3.11 "
+                                  "or the tomli package") from None
+        with open(path, "rb") as config_file:
+            return tomllib.load(config_file)
+
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("Reading YAML files needs "
+                              "the PyYAML package") from None
+        with open(path, encoding="utf-8") as config_file:
+            try:
+                return yaml.safe_load(config_file)
+            except yaml.YAMLError as err:
+                raise ValueError("Invalid YAML: {}".format(err)) from None
+
+    raise ValueError("Unknown configuration file type: " + path)
+
+
+def build_comparator(options):
+    """ Builds a comparison function from its options.
+        Returns None for a plain byte comparison """
+    options = dict(options or {})
+    comparator_type = options.pop("type", "bytes")
+
+    if comparator_type not in COMPARATOR_OPTIONS:
+        raise ValueError("Unknown comparator type: " + str(comparator_type))
+    check_options(options, COMPARATOR_OPTIONS[comparator_type],
+                  "the {} comparator".format(comparator_type))
+
+    if comparator_type == "bytes":
+        return None
+
+    try:
+        return COMPARATORS[comparator_type](**options)
+    except TypeError as err:
+        raise ValueError("Bad options for the {} comparator: {}"
+                         .format(comparator_type, err)) from None
+
+
+def build_alert_function(options):
+    """ Builds an alert function from its options """
+    options = dict(options or {})
+    alert_type = options.pop("type", "log")
+
+    if alert_type not in ALERT_OPTIONS:
+        raise ValueError("Unknown alert type: " + str(alert_type))
+    check_options(options, ALERT_OPTIONS[alert_type],
+                  "the {} alert".format(alert_type))
+
+    if alert_type == "log":
+        def log_alert(url, data):
+            logging.warning("Change found on %s:\n%s", url, data)
+        return log_alert
+
+    if alert_type == "print":
+        def print_alert(url, data):
+            print("Change found on {}:\n{}".format(url, data), flush=True)
+        return print_alert
+
+    if alert_type == "file":
+        if "path" not in options:
+            raise ValueError("The file alert needs a path")
+        path = options["path"]
+
+        def file_alert(url, data):
+            with open(path, "a", encoding="utf-8") as alert_file:
+                alert_file.write("Change found on {}:\n{}\n".format(url, data))
+        return file_alert
+
+
+def build_transport(options):
+    """ Builds a transport from its options.
+        Returns None for the default requests transport """
+    options = dict(options or {})
+    transport_type = options.pop("type", "requests")
+
+    if transport_type not in TRANSPORT_OPTIONS:
+        raise ValueError("Unknown transport type: " + str(transport_type))
+    check_options(options, TRANSPORT_OPTIONS[transport_type],
+                  "the {} transport".format(transport_type))
+
+    if transport_type == "requests":
+        return None
+    return HTTP2Transport(**options)
+
+
+def build_watcher(options, transport=None):
+    """ Builds a PageWatcher from its options.  The types of the
+        options are checked here so that a mistake in the file is
+        reported as a ValueError naming the option """
+    if not isinstance(options, dict):
+        raise ValueError("Every watcher should be a mapping")
+    if "url" not in options:
+        raise ValueError("Every watcher needs a url")
+    check_options(options, WATCHER_OPTIONS,
+                  "the watcher of {!r}".format(options["url"]))
+
+    if options.get("interval", 120) <= 0:
+        raise ValueError("The interval of {} should be a positive number "
+                         "of seconds".format(options["url"]))
+
+    probe_headers = options.get("probe_headers", DEFAULT_PROBE_HEADERS)
+    if not all(isinstance(header, str) for header in probe_headers):
+        raise ValueError("The probe_headers of {} should be a list of "
+                         "header names".format(options["url"]))
+
+    return PageWatcher(
+        options["url"],
+        time_interval=options.get("interval", 120),
+        comparison_function=build_comparator(options.get("comparator")),
+        ignore_errors=options.get("ignore_errors", True),
+        probe_method=options.get("probe"),
+        probe_headers=tuple(probe_headers),
+        transport=transport)
+
+
+def build_manager(config):
+    """ Builds a WatcherManager from a loaded configuration """
+    if not isinstance(config, dict):
+        raise ValueError("The configuration should be a mapping")
+    check_options(config, {"alert": (dict, type(None)),
+                           "transport": (dict, type(None)),
+                           "watchers": (list,)},
+                  "the configuration")
+
+    transport = build_transport(config.get("transport"))
+    return WatcherManager(
+        [build_watcher(options, transport)
+         for options in config.get("watchers", [])],
+        alert_function=build_alert_function(config.get("alert")))
@@ -0,0 +1,209 @@
+""" Functions that build short textual reports of the differences
+    between two strings.  The cost of a report grows with the number
+    of differences rather than the size of the strings """
+import re
+
+
+def split_words(text):
+    """ splits a string into its words """
+    return re.findall(r"\S+", text)
+
+
+def split_lines(text):
+    """ splits a string into its lines """
+    return text.splitlines()
+
+
+def myers_diff(old, new, max_edits=None):
+    """ finds the shortest edit script between two sequences using
+        Myers' O(ND) algorithm.  returns a list of ("-", old_index,
+        new_index) deletions and ("+", old_index, new_index) insertions
+        in order, or None if more than max_edits edits are needed """
+    # Skip the items that are the same at the start and end
+    prefix = 0
+    while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+        prefix += 1
+    old_end = len(old)
+    new_end = len(new)
+    while old_end > prefix and new_end > prefix and \
+            old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+    old = old[prefix:old_end]
+    new = new[prefix:new_end]
+
+    old_length = len(old)
+    new_length = len(new)
+    most_edits = old_length + new_length
+    if max_edits is not None:
+        most_edits = min(most_edits, max_edits)
+
+    # furthest[k] is the furthest x reached on diagonal k = x - y
+    furthest = {1: 0}
+    trace = []
+    for edits in range(most_edits + 1):
+        trace.append(furthest.copy())
+        for diagonal in range(-edits, edits + 1, 2):
+            if diagonal == -edits or (diagonal != edits and
+                                      furthest[diagonal - 1] <
+                                      furthest[diagonal + 1]):
+                x = furthest[diagonal + 1]
+            else:
+                x = furthest[diagonal - 1] + 1
+            y = x - diagonal
+
+            while x < old_length and y < new_length and old[x] == new[y]:
+                x += 1
+                y += 1
+            furthest[diagonal] = x
+
+            if x >= old_length and y >= new_length:
+                return _backtrack(trace, old_length, new_length, prefix)
+
+    return None
+
+
+def _backtrack(trace, x, y, offset):
+    """ walks the trace of a Myers search back from the end
+        to recover the edits that were made """
+    script = []
+    for edits in range(len(trace) - 1, 0, -1):
+        furthest = trace[edits]
+        diagonal = x - y
+        if diagonal == -edits or (diagonal != edits and
+                                  furthest[diagonal - 1] <
+                                  furthest[diagonal + 1]):
+            previous_diagonal = diagonal + 1
+        else:
+            previous_diagonal = diagonal - 1
+        previous_x = furthest[previous_diagonal]
+        previous_y = previous_x - previous_diagonal
+
+        # Walk back along the matching items before looking at the edit
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+
+        if x == previous_x:
+            script.append(("+", previous_x + offset, previous_y + offset))
+        else:
+            script.append(("-", previous_x + offset, previous_y + offset))
+        x = previous_x
+        y = previous_y
+
+    script.reverse()
+    return script
+
+
+def _hunks(script, context):
+    """ groups the edits of a script into hunks.  edits separated
+        by no more than twice the context are put in the same hunk """
+    hunks = []
+    current = []
+    for edit in script:
+        if current:
+            kind, last_x, _ = current[-1]
+            # The position right after the last edit
+            next_x = last_x + (kind == "-")
+            if edit[1] - next_x > context * 2:
+                hunks.append(current)
+                current = []
+        current.append(edit)
+    if current:
+        hunks.append(current)
+    return hunks
+
+
+def _hunk_lines(hunk, old, new, context):
+    """ yields the lines of a single hunk """
+    old_start = max(hunk[0][1] - context, 0)
+    new_start = max(hunk[0][2] - context, 0)
+    _, last_x, last_y = hunk[-1]
+    if hunk[-1][0] == "-":
+        last_x += 1
+    else:
+        last_y += 1
+    old_stop = min(last_x + context, len(old))
+    new_stop = min(last_y + context, len(new))
+
+    yield "@@ -{},{} +{},{} @@".format(old_start + 1, old_stop - old_start,
+                                       new_start + 1, new_stop - new_start)
+
+    x = old_start
+    y = new_start
+    for kind, edit_x, edit_y in hunk:
+        while x < edit_x:
+            yield " " + old[x]
+            x += 1
+            y += 1
+        if kind == "-":
+            yield "-" + old[x]
+            x += 1
+        else:
+            yield "+" + new[y]
+            y += 1
+    while x < old_stop:
+        yield " " + old[x]
+        x += 1
+
+
+def diff_lines(old_text, new_text, granularity="line", context=3,
+               max_edits=500):
+    """ returns an iterator over the lines of a unified diff style
+        report of the differences between two strings, or None if
+        there are no differences at this granularity.  granularity is
+        "line" or "word".  a single line summary is given instead if
+        more than max_edits are needed """
+    if granularity == "word":
+        old = split_words(old_text)
+        new = split_words(new_text)
+    elif granularity == "line":
+        old = split_lines(old_text)
+        new = split_lines(new_text)
+    else:
+        raise ValueError("Unknown diff granularity: " + str(granularity))
+
+    script = myers_diff(old, new, max_edits)
+    if script is None:
+        return iter(["More than {} {}s changed ({} -> {} {}s)".format(
+            max_edits, granularity, len(old), len(new), granularity)])
+    if not script:
+        return None
+
+    # The lines are only made as they are joined into the report
+    return (line for hunk in _hunks(script, context)
+            for line in _hunk_lines(hunk, old, new, context))
+
+
+def bounded_join(lines, max_length):
+    """ joins lines with newlines into a string of no more than
+        max_length characters.  when the lines don't fit the last
+        ones are dropped to make room for a note that the report was
+        truncated, the note itself is cut short if it doesn't fit """
+    kept = []
+    # Joining n lines adds n - 1 newlines
+    length = -1
+    for line in lines:
+        if length + len(line) + 1 > max_length:
+            marker = "... report truncated at {} characters"\
+                .format(max_length)
+            while kept and length + len(marker) + 1 > max_length:
+                length -= len(kept.pop()) + 1
+            kept.append(marker)
+            return "\n".join(kept)[:max_length]
+        length += len(line) + 1
+        kept.append(line)
+
+    return "\n".join(kept)
+
+
+def diff_report(old_text, new_text, granularity="line", context=3,
+                max_length=4096, max_edits=500):
+    """ returns a unified diff style report of the differences
+        between two strings.  granularity is "line" or "word".
+        the report is never longer than max_length characters and
+        is not built at all if more than max_edits are needed """
+    lines = diff_lines(old_text, new_text, granularity, context, max_edits)
+    if lines is None:
+        return ""
+    return bounded_join(lines, max_length)
@@ -0,0 +1,47 @@
+""" Times the comparators on a large page.  This isn't run by pytest,
+    run it with: python -m http_page_monitor.tests.benchmark_comparators """
+from time import perf_counter
+from .. import comparators
+
+
+def generate_large_page(word_count, changed_word=None):
+    """ Builds a page with a single paragraph of word_count words """
+    words = ["word{}".format(index % 5000) for index in range(word_count)]
+    if changed_word is not None:
+        words[changed_word] = "changed"
+    return "<html><body><p>{}</p></body></html>".format(" ".join(words))
+
+
+def benchmark(name, compare, old_page, new_page, runs=5):
+    """ Prints the best time of a check.  The pages take turns being
+        the new page like consecutive checks of a watcher, so the
+        comparators that remember the last page are timed with it """
+    pages = [old_page, new_page]
+    times = []
+    for run in range(runs + 1):
+        start = perf_counter()
+        compare(pages[run % 2], pages[(run + 1) % 2])
+        times.append(perf_counter() - start)
+    # The first check has nothing remembered
+    print("{:<40}{:>8.3f}s first, {:.3f}s after".format(
+        name, times[0], min(times[1:])))
+
+
+def main(word_count=100000):
+    """ Compare the comparators on a page of word_count words """
+    old_page = generate_large_page(word_count)
+    new_page = generate_large_page(word_count, changed_word=word_count // 2)
+    print("{} words".format(word_count))
+    benchmark("html_text_comparison",
+              comparators.html_text_comparison(), old_page, new_page)
+    benchmark("html_text_comparison (word diff)",
+              comparators.html_text_comparison(diff_granularity="word"),
+              old_page, new_page)
+    benchmark("html_fingerprint_comparison",
+              comparators.html_fingerprint_comparison(), old_page, new_page)
+    benchmark("html_tag_comparison",
+              comparators.html_tag_comparison(), old_page, new_page)
+
+
+if __name__ == "__main__":
+    main()
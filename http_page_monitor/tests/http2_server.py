@@ -0,0 +1,166 @@
+""" A small HTTP/2 server for testing the HTTP/2 transport.  It speaks
+    HTTP/2 with prior knowledge over plain TCP, or over TLS offering h2
+    with ALPN, and counts the connections and requests it gets.  The
+    answers to requests for /slow are held back for a moment so the
+    number of requests in flight at once can be counted """
+from threading import Thread, Lock
+from time import monotonic
+import os
+import socket
+import ssl
+import h2.config
+import h2.connection
+import h2.events
+
+# How long the answers to requests for /slow are held back
+SLOW_DELAY = 0.1
+
+# A self signed certificate and key for localhost
+CERTIFICATE = os.path.join(os.path.dirname(__file__), "localhost.pem")
+
+
+def server_ssl_context(protocols):
+    """ Returns a server TLS context using the localhost certificate
+        that offers the given protocols with ALPN """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERTIFICATE)
+    context.set_alpn_protocols(protocols)
+    return context
+
+
+def client_ssl_context():
+    """ Returns a client TLS context that trusts the
+        localhost certificate """
+    return ssl.create_default_context(cafile=CERTIFICATE)
+
+
+class LoggingHTTP2Server:
+    """ Answers every request with a short page and keeps
+        count of the connections and requests made to it """
+    def __init__(self, tls=False):
+        # Connections are wrapped in TLS when there is a context
+        self.ssl_context = server_ssl_context(["h2"]) if tls else None
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('localhost', 0))
+        self.listener.listen()
+        self.count_lock = Lock()
+        self.reset_log()
+
+    def reset_log(self):
+        """ Reset the counts """
+        with self.count_lock:
+            self.connection_count = 0
+            self.request_count = 0
+            # The requests for /slow waiting for an answer
+            self.in_flight = 0
+            self.most_in_flight = 0
+
+    def generate_address(self, route):
+        """ Returns the address of a route on this server """
+        scheme = "http" if self.ssl_context is None else "https"
+        return scheme + "://localhost:" +\
+            str(self.listener.getsockname()[1]) + route
+
+    def handle_requests(self):
+        """ Starts up the server. Can be stopped by calling shutdown() """
+        thread = Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def serve_forever(self):
+        """ Accept connections until the server is shut down """
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            with self.count_lock:
+                self.connection_count += 1
+            Thread(target=self.handle_connection, args=(connection,),
+                   daemon=True).start()
+
+    def handle_connection(self, connection):
+        """ Answer the requests made over a single connection """
+        if self.ssl_context is not None:
+            try:
+                connection = self.ssl_context.wrap_socket(connection,
+                                                          server_side=True)
+            except OSError:
+                connection.close()
+                return
+
+        h2_connection = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False,
+                                             header_encoding='utf-8'))
+        h2_connection.initiate_connection()
+        connection.sendall(h2_connection.data_to_send())
+
+        # The (due time, event) pairs of the held back requests, the
+        # connection is woken up regularly to answer them when due
+        held_back = []
+        connection.settimeout(SLOW_DELAY / 4)
+
+        with connection:
+            while True:
+                try:
+                    data = connection.recv(65535)
+                except socket.timeout:
+                    data = None
+                except OSError:
+                    return
+                if data == b"":
+                    return
+
+                for event in h2_connection.receive_data(data or b""):
+                    if isinstance(event, h2.events.RequestReceived) and \
+                            dict(event.headers)[':path'] == '/slow':
+                        held_back.append((monotonic() + SLOW_DELAY, event))
+                        with self.count_lock:
+                            self.in_flight += 1
+                            self.most_in_flight = max(self.most_in_flight,
+                                                      self.in_flight)
+                    elif isinstance(event, h2.events.RequestReceived):
+                        self.respond(h2_connection, event)
+                    elif isinstance(event, h2.events.DataReceived):
+                        h2_connection.acknowledge_received_data(
+                            event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        connection.sendall(h2_connection.data_to_send())
+                        return
+
+                now = monotonic()
+                for due in [item for item in held_back if item[0] <= now]:
+                    held_back.remove(due)
+                    with self.count_lock:
+                        self.in_flight -= 1
+                    self.respond(h2_connection, due[1])
+
+                connection.sendall(h2_connection.data_to_send())
+
+    def respond(self, h2_connection, event):
+        """ Answer a single request """
+        headers = dict(event.headers)
+        body = "Response {}".format(headers[':path']).encode('utf-8')
+        is_head = headers[':method'] == 'HEAD'
+
+        h2_connection.send_headers(event.stream_id, [
+            (':status', '200'),
+            ('content-type', 'text/html'),
+            ('content-length', str(len(body))),
+            ('etag', '"h2"'),
+        ], end_stream=is_head)
+        if not is_head:
+            h2_connection.send_data(event.stream_id, body, end_stream=True)
+
+        with self.count_lock:
+            self.request_count += 1
+
+    def shutdown(self):
+        """ Stop accepting connections """
+        self.listener.close()
+
+
+def setup_http2_server(tls=False):
+    """ Gets an HTTP/2 testing server ready to go """
+    return LoggingHTTP2Server(tls)
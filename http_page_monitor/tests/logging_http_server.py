@@ -4,6 +4,7 @@ from http.server import HTTPServer, BaseHTTPRequestHandler
 from random import randint
 from datetime import datetime
 from threading import Thread
+from collections import Counter
 
 
 class UpdatingWebsite(BaseHTTPRequestHandler):
@@ -12,6 +13,13 @@ class UpdatingWebsite(BaseHTTPRequestHandler):
 
     def do_GET(self):
         """ Return a page """
+        if self.path == "/static":
+            self.send_static_page()
+            return 0
+        if self.path == "/static_length_only":
+            self.send_static_page(include_validators=False)
+            return 0
+
         self.send_response(200)
         self.send_header("Content-type", "text/html")
         self.end_headers()
@@ -26,8 +34,54 @@ class UpdatingWebsite(BaseHTTPRequestHandler):
             # Log the request and increment the request counter
         self.server.log(datetime.now())
         self.server.request_count += 1
+        self.server.method_counts[self.command] += 1
+        return 0
+
+    def do_HEAD(self):
+        """ Return the headers of a page """
+        if self.path == "/static":
+            self.send_static_page(include_body=False)
+        elif self.path == "/static_length_only":
+            self.send_static_page(include_body=False,
+                                  include_validators=False)
+        else:
+            self.send_response(200)
+            self.send_header("Content-type", "text/html")
+            self.end_headers()
+            self.server.log(datetime.now())
+            self.server.request_count += 1
+            self.server.method_counts[self.command] += 1
         return 0
 
+    def send_static_page(self, include_body=True, include_validators=True):
+        """ Return a page with validators that only change
+            when the server's static_version is changed.  Without
+            validators only the Content-Length is sent """
+        body = "Static {}".format(self.server.static_version).encode('utf-8')
+        ranged = self.headers.get("Range") == "bytes=0-0"
+
+        self.send_response(206 if ranged else 200)
+        self.send_header("Content-type", "text/html")
+        if include_validators:
+            self.send_header("ETag",
+                             '"static-{}"'.format(self.server.static_version))
+        if ranged:
+            self.send_header("Content-Range",
+                             "bytes 0-0/{}".format(len(body)))
+            body = body[:1]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+        self.server.log(datetime.now())
+        self.server.request_count += 1
+        # Count ranged requests separately from full requests
+        if ranged:
+            self.server.method_counts[self.command + " range"] += 1
+        else:
+            self.server.method_counts[self.command] += 1
+
 
 class LoggingHTTPServer(HTTPServer):
     """ This is an extension to the base HTTPServer that
@@ -36,6 +90,7 @@ class LoggingHTTPServer(HTTPServer):
     def __init__(self, *args, **kwargs):
         self.reset_log()
         self.running = False
+        self.scheme = "http"
         super().__init__(*args, **kwargs)
 
     def log(self, data):
@@ -46,11 +101,19 @@ class LoggingHTTPServer(HTTPServer):
         """ Reset the entire log """
         self.data_log = []
         self.request_count = 0
+        self.method_counts = Counter()
+        self.static_version = 1
+
+    def use_tls(self, ssl_context):
+        """ Serve over TLS using the given server context """
+        self.socket = ssl_context.wrap_socket(self.socket, server_side=True)
+        self.scheme = "https"
 
     def generate_address(self, route):
         """ Returns a base address string used for
             accessing this server such as "localhost:5000" """
-        return "http://localhost:" + str(self.server_address[1]) + route
+        return self.scheme + "://localhost:" + str(self.server_address[1]) +\
+            route
 
     def handle_requests(self):
         """ Starts up the server. Can be stopped by calling shutdown() """
@@ -1,5 +1,7 @@
 """ Tests the comparators that are used to compare reponses """
 import unittest
+import time
+from threading import Thread
 from bs4 import BeautifulSoup
 from .. import comparators
 
@@ -52,6 +54,35 @@ class TestHelperFunctions(unittest.TestCase):
                 soup_page_just_tags.prettify()
         )
 
+    def test_comparable_text(self):
+        """ Test that case and white space are removed when asked """
+        texts = ["Some Text", " a\tb "]
+        self.assertEqual(comparators.comparable_text(texts, True, False),
+                         texts)
+        self.assertEqual(comparators.comparable_text(texts, False, True),
+                         ["sometext", "ab"])
+
+    def test_last_page_cache(self):
+        """ Test that the value of a page is remembered
+            until the page is replaced """
+        cache = comparators.LastPageCache()
+        self.assertEqual(cache.get("page1", len), 5)
+        cache.remember("page1", "value1")
+        self.assertEqual(cache.get("page1", len), "value1")
+        cache.remember("other", "other value")
+        cache.remember("page2", "value2", replaces="page1")
+        self.assertEqual(cache.get("page1", len), 5)
+        self.assertEqual(cache.get("page2", len), "value2")
+        self.assertEqual(cache.get("other", len), "other value")
+
+    def test_last_page_cache_limit(self):
+        """ Test that the oldest value is forgotten """
+        cache = comparators.LastPageCache(max_pages=2)
+        for page in ("page1", "page2", "page3"):
+            cache.remember(page, page.upper())
+        self.assertEqual(cache.get("page1", len), 5)
+        self.assertEqual(cache.get("page3", len), "PAGE3")
+
     def test_remove_attributes_from_soup(self):
         """ Test if attributes are removed properly """
         page =\
@@ -208,6 +239,62 @@ class TestTextComparisons(unittest.TestCase):
         self.assertEqual(compare(self.page_base,
                                  self.page_whitespace_and_case_change), None)
 
+    def test_diff_report(self):
+        """ Test that a diff of the changed element is reported """
+        compare = comparators.html_text_comparison("ol > li",
+                                                   diff_granularity="word")
+        self.assertEqual(compare(self.page_base, self.page_html_text_change),
+                         "Text differences found:\n"
+                         "Element 2:\n@@ -1,1 +1,1 @@\n-item2\n+item3")
+
+    def test_diff_report_extra_element(self):
+        """ Test the diff when the number of elements changes """
+        compare = comparators.html_text_comparison("ol > li",
+                                                   diff_granularity="line")
+        self.assertIn("+item3",
+                      compare(self.page_base, self.page_extra_element))
+
+    def test_diff_report_max_length(self):
+        """ Test that the whole report is cut off """
+        compare = comparators.html_text_comparison(diff_granularity="word",
+                                                   max_report_length=20)
+        old_page = generate_page("Test1", " ".join(["a"] * 1000))
+        new_page = generate_page("Test1", " ".join(["b"] * 1000))
+        self.assertEqual(compare(old_page, new_page), "... report truncated")
+
+        # The headers and the marker count towards the length as well
+        for max_report_length in (40, 100, 1000):
+            compare = comparators.html_text_comparison(
+                "li", diff_granularity="word",
+                max_report_length=max_report_length)
+            # Every fifth word changed, once more with an element added
+            old_item = " ".join("a{}".format(i) for i in range(1000))
+            new_item = " ".join("b{}".format(i) if i % 5 == 0
+                                else "a{}".format(i) for i in range(1000))
+            for new_items in (new_item, new_item + "</li><li>c"):
+                report = compare("<li>" + old_item + "</li>",
+                                 "<li>" + new_items + "</li>")
+                self.assertLessEqual(len(report), max_report_length)
+                self.assertIn("report truncated", report)
+
+    def test_diff_report_whitespace_change(self):
+        """ Test that a change to the spacing between words
+            isn't a difference when diffing words """
+        compare = comparators.html_text_comparison("li",
+                                                   diff_granularity="word")
+        self.assertEqual(compare("<li>a b</li><li>c</li>",
+                                 "<li>a  b</li><li>c</li>"), None)
+        self.assertEqual(compare("<li>a b</li><li>c</li>",
+                                 "<li>a  b</li><li>d</li>"),
+                         "Text differences found:\n"
+                         "Element 2:\n@@ -1,1 +1,1 @@\n-c\n+d")
+
+    def test_unknown_diff_granularity(self):
+        """ Test that an unknown granularity is found when
+            the comparison function is made """
+        with self.assertRaises(ValueError):
+            comparators.html_text_comparison(diff_granularity="char")
+
 
 class TestHTMLComparisons(unittest.TestCase):
     """ Tests the text comparison function generator """
@@ -314,3 +401,212 @@ class TestHTMLComparisons(unittest.TestCase):
         compare = comparators.html_tag_comparison()
         self.assertEqual(compare(self.page_base,
                                  self.page_whitespace_and_case_change), None)
+
+    def test_difference_paths(self):
+        """ Test that the path of each changed node is reported """
+        compare = comparators.html_tag_comparison()
+        self.assertEqual(compare(self.page_base, self.page_extra_element),
+                         "HTML differences found:\n"
+                         "/html/body/ol/li[3]: added")
+        self.assertEqual(compare(self.page_base, self.page_attribute),
+                         "HTML differences found:\n"
+                         "/html/body/ol: attributes '' -> "
+                         "'type=\"something\"'")
+
+    def test_inserted_element_path(self):
+        """ Test that inserting an element doesn't report its siblings """
+        compare = comparators.html_tag_comparison()
+        self.assertEqual(compare("<ul><li></li><li><b></b></li></ul>",
+                                 "<ul><li></li><p></p><li><b></b></li></ul>"),
+                         "HTML differences found:\n/ul/p: added")
+        self.assertEqual(compare("<ul><li></li><p></p><li><b></b></li></ul>",
+                                 "<ul><li></li><li><b></b></li></ul>"),
+                         "HTML differences found:\n/ul/p: removed")
+
+    def test_many_selected_siblings(self):
+        """ Test selecting thousands of siblings, finding their paths
+            used to take quadratic time """
+        old_page = "<ul>" + "<li></li>" * 4000 + "</ul>"
+        new_page = "<ul>" + "<li></li>" * 3999 + "<li class=\"x\"></li></ul>"
+        compare = comparators.html_tag_comparison("li")
+
+        start = time.perf_counter()
+        self.assertEqual(compare(old_page, new_page),
+                         "HTML differences found:\n"
+                         "/ul/li[4000]: attributes '' -> 'class=\"x\"'")
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_consecutive_comparisons(self):
+        """ Test that the remembered hash trees are used for the old page """
+        compare = comparators.html_tag_comparison()
+        self.assertIn("HTML differences found:\n",
+                      compare(self.page_base, self.page_attribute))
+        self.assertEqual(compare(self.page_attribute, self.page_attribute),
+                         None)
+        self.assertIn("HTML differences found:\n",
+                      compare(self.page_attribute, self.page_base))
+
+    def test_shared_between_threads(self):
+        """ Test a comparison function shared by threads
+            that each compare their own pages """
+        compare = comparators.html_tag_comparison()
+        failures = []
+
+        def compare_pages(old_page, new_page):
+            for _ in range(50):
+                if compare(old_page, old_page) is not None or \
+                        compare(old_page, new_page) is None or \
+                        compare(new_page, old_page) is None:
+                    failures.append((old_page, new_page))
+
+        threads = [Thread(target=compare_pages,
+                          args=(self.page_base, self.page_attribute)),
+                   Thread(target=compare_pages,
+                          args=(self.page_extra_element,
+                                self.page_base))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+
+    def test_hash_tree_ignores_text(self):
+        """ Test that text isn't part of the hash tree """
+        old_tree = comparators.tag_hash_tree(
+            BeautifulSoup(self.page_base, features="html.parser"))
+        new_tree = comparators.tag_hash_tree(
+            BeautifulSoup(self.page_html_text_change, features="html.parser"))
+        self.assertEqual(old_tree.digest, new_tree.digest)
+
+
+class TestFingerprintComparisons(unittest.TestCase):
+    """ Tests the fingerprint comparison function generator """
+    def setUp(self):
+        """ Create some long pages we can compare against each other """
+        words = ["word{}".format(i) for i in range(400)]
+        self.page_base = generate_page(
+            "Test1", "<p>{}</p><p>footer</p>".format(" ".join(words)))
+
+        words[200] = "changed"
+        self.page_small_change = generate_page(
+            "Test1", "<p>{}</p><p>footer</p>".format(" ".join(words)))
+
+        words[100:140] = ["changed{}".format(i) for i in range(40)]
+        self.page_medium_change = generate_page(
+            "Test1", "<p>{}</p><p>footer</p>".format(" ".join(words)))
+
+        other_words = ["other{}".format(i) for i in range(400)]
+        self.page_rewritten = generate_page(
+            "Test1", "<p>{}</p><p>footer</p>".format(" ".join(other_words)))
+
+    def test_shingle_hashes(self):
+        """ Test that the shingles overlap and short text is kept """
+        self.assertEqual(len(comparators.shingle_hashes("a b c d", 3)), 2)
+        self.assertEqual(comparators.shingle_hashes("a b c d", 3)[1],
+                         comparators.shingle_hashes("b c d", 3)[0])
+        self.assertEqual(len(comparators.shingle_hashes("a b", 3)), 1)
+        self.assertEqual(len(comparators.shingle_hashes(" ", 3)), 0)
+
+    def test_simhash(self):
+        """ Test that each bit is set by a majority of the hashes """
+        self.assertEqual(comparators.simhash([]), 0)
+        self.assertEqual(comparators.simhash([0b101, 0b100, 0b001]), 0b101)
+        self.assertEqual(comparators.simhash([-1, -1, 0]), 2**64 - 1)
+
+    def test_fingerprint_similarity(self):
+        """ Test the similarity estimate of two fingerprints """
+        self.assertEqual(comparators.fingerprint_similarity(5, 5), 1)
+        self.assertEqual(comparators.fingerprint_similarity(0, 2**64 - 1), 0)
+
+    def test_equal_pages(self):
+        """ Test that equal pages are not reported """
+        compare = comparators.html_fingerprint_comparison()
+        self.assertEqual(compare(self.page_base, self.page_base), None)
+
+    def test_small_change_ignored(self):
+        """ Test that a single changed word is below the threshold """
+        compare = comparators.html_fingerprint_comparison()
+        self.assertEqual(compare(self.page_base, self.page_small_change),
+                         None)
+
+    def test_medium_change(self):
+        """ Test that a tenth of the words changing is only reported
+            with a strict threshold """
+        compare = comparators.html_fingerprint_comparison()
+        self.assertEqual(compare(self.page_base, self.page_medium_change),
+                         None)
+        compare = comparators.html_fingerprint_comparison(threshold=1)
+        self.assertIn("Page similarity of",
+                      compare(self.page_base, self.page_medium_change))
+
+    def test_rewritten_page(self):
+        """ Test that a rewritten page is reported """
+        compare = comparators.html_fingerprint_comparison()
+        self.assertIn("Page similarity of",
+                      compare(self.page_base, self.page_rewritten))
+
+    def test_consecutive_comparisons(self):
+        """ Test that the remembered fingerprint is used for the old page """
+        compare = comparators.html_fingerprint_comparison()
+        self.assertIn("Page similarity of",
+                      compare(self.page_base, self.page_rewritten))
+        self.assertEqual(compare(self.page_rewritten, self.page_rewritten),
+                         None)
+        self.assertIn("Page similarity of",
+                      compare(self.page_rewritten, self.page_base))
+
+    def test_drifting_page(self):
+        """ Test that small changes on every check add up to a report """
+        compare = comparators.html_fingerprint_comparison()
+        words = ["word{}".format(i) for i in range(2000)]
+        old_page = generate_page("Test1", " ".join(words))
+
+        alerts = []
+        for check in range(100):
+            changed = range(check * 10, check * 10 + 10)
+            words[changed.start:changed.stop] = \
+                ["new{}".format(i) for i in changed]
+            new_page = generate_page("Test1", " ".join(words))
+            # Each check on its own changes too little to be reported
+            self.assertEqual(
+                comparators.html_fingerprint_comparison()(old_page, new_page),
+                None)
+            alerts.append(compare(old_page, new_page))
+            old_page = new_page
+
+        # Half of the page was rewritten so the changes were reported,
+        # but not on every check
+        reports = [alert for alert in alerts if alert is not None]
+        self.assertGreater(len(reports), 0)
+        self.assertLess(len(reports), 20)
+
+    def test_drifting_pages_shared_comparison(self):
+        """ Test that watchers sharing a comparison function
+            each keep the reference of their own page """
+        compare = comparators.html_fingerprint_comparison()
+        pages = {}
+        alerts = {}
+        for name in ("first", "second"):
+            words = ["{}{}".format(name, i) for i in range(2000)]
+            pages[name] = (words, generate_page("Test1", " ".join(words)))
+            alerts[name] = 0
+
+        for check in range(100):
+            for name, (words, old_page) in pages.items():
+                changed = range(check * 10, check * 10 + 10)
+                words[changed.start:changed.stop] = \
+                    ["new{}{}".format(name, i) for i in changed]
+                new_page = generate_page("Test1", " ".join(words))
+                if compare(old_page, new_page) is not None:
+                    alerts[name] += 1
+                pages[name] = (words, new_page)
+
+        for name in pages:
+            self.assertGreater(alerts[name], 0)
+            self.assertLess(alerts[name], 20)
+
+    def test_selector(self):
+        """ Test that only the selected elements are fingerprinted """
+        compare = comparators.html_fingerprint_comparison(selector="title",
+                                                          threshold=1)
+        self.assertEqual(compare(self.page_base, self.page_rewritten), None)
@@ -0,0 +1,204 @@
+""" Tests building watchers from configuration files """
+import unittest
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from .. import config
+from ..__main__ import main
+
+
+class TestConfig(unittest.TestCase):
+    """ Tests the configuration loader and builders """
+    def setUp(self):
+        """ A configuration using every kind of comparator """
+        self.config = {
+            "alert": {"type": "print"},
+            "watchers": [
+                {"url": "http://localhost/1"},
+                {"url": "http://localhost/2", "interval": 30,
+                 "comparator": {"type": "text", "selector": "h1",
+                                "case_sensitive": False}},
+                {"url": "http://localhost/3",
+                 "comparator": {"type": "tag", "ignore_attributes": True}},
+                {"url": "http://localhost/4", "probe": "head",
+                 "comparator": {"type": "fingerprint", "threshold": 0.5}},
+            ]
+        }
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_file(self, name, text):
+        """ Write a file into the temporary directory """
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8") as config_file:
+            config_file.write(text)
+        return path
+
+    def test_build_manager(self):
+        """ Test that every watcher is built """
+        manager = config.build_manager(self.config)
+        self.assertEqual([watcher.url for watcher in manager.watchers],
+                         ["http://localhost/1", "http://localhost/2",
+                          "http://localhost/3", "http://localhost/4"])
+        self.assertEqual(manager.watchers[0].compare_content, None)
+        self.assertEqual(manager.watchers[1].frequency, 30)
+        self.assertEqual(
+            manager.watchers[1].compare_content("<h1>A</h1>", "<h1>a</h1>"),
+            None)
+        self.assertEqual(manager.watchers[3].probe_method, "head")
+
+    def test_bad_options(self):
+        """ Test that bad options are reported as value errors """
+        with self.assertRaises(ValueError):
+            config.build_comparator({"type": "text", "color": "red"})
+        with self.assertRaises(ValueError):
+            config.build_comparator({"type": "pixels"})
+        with self.assertRaises(ValueError):
+            config.build_comparator({"type": "text",
+                                     "diff_granularity": "char"})
+        with self.assertRaises(ValueError):
+            config.build_alert_function({"type": "file"})
+        with self.assertRaises(ValueError):
+            config.build_watcher({"interval": 5})
+        with self.assertRaises(ValueError):
+            config.build_transport({"type": "carrier pigeon"})
+
+    def test_bad_option_types(self):
+        """ Test that options of the wrong type are value errors """
+        for options in ({"url": 5},
+                        {"url": "http://localhost/", "interval": "60"},
+                        {"url": "http://localhost/", "interval": 0},
+                        {"url": "http://localhost/", "interval": True},
+                        {"url": "http://localhost/", "ignore_errors": "no"},
+                        {"url": "http://localhost/", "probe_headers": "ETag"},
+                        {"url": "http://localhost/", "probe_headers": [1]},
+                        "http://localhost/"):
+            with self.subTest(options=options):
+                with self.assertRaises(ValueError):
+                    config.build_watcher(options)
+        with self.assertRaises(ValueError):
+            config.build_manager({"watchers": {"url": "http://localhost/"}})
+
+    def test_unknown_options(self):
+        """ Test that misspelled options are value errors """
+        with self.assertRaises(ValueError):
+            config.build_watcher({"url": "http://localhost/", "intreval": 5,
+                                  "comparitor": {"type": "tag"}})
+        with self.assertRaises(ValueError):
+            config.build_alert_function({"type": "print", "path": "a.log"})
+        with self.assertRaises(ValueError):
+            config.build_transport({"type": "http2", "streams": 10})
+        with self.assertRaises(ValueError):
+            config.build_manager({"watcher": []})
+
+    def test_bad_comparator_option_types(self):
+        """ Test that comparator options of the wrong type
+            are found before anything is compared """
+        for options in ({"type": "fingerprint", "threshold": "0.9"},
+                        {"type": "fingerprint", "shingle_size": 2.5},
+                        {"type": "text", "selector": 1},
+                        {"type": "text", "diff_context": True},
+                        {"type": "tag", "ignore_attributes": "yes"}):
+            with self.subTest(options=options):
+                with self.assertRaises(ValueError):
+                    config.build_comparator(options)
+        with self.assertRaises(ValueError):
+            config.build_transport({"type": "http2", "max_streams": "10"})
+        with self.assertRaises(ValueError):
+            config.build_alert_function({"type": "file", "path": 5})
+
+        compare = config.build_comparator({"type": "fingerprint",
+                                           "threshold": 1, "selector": None})
+        self.assertEqual(compare("<p>a</p>", "<p>a</p>"), None)
+
+        watcher = config.build_watcher({"url": "http://localhost/",
+                                        "interval": 0.5,
+                                        "probe_headers": ["ETag"]})
+        self.assertEqual(watcher.frequency, 0.5)
+        self.assertEqual(watcher.probe_headers, ("ETag",))
+
+    def test_http2_transport(self):
+        """ Test that the watchers share an HTTP/2 transport """
+        self.config["transport"] = {"type": "http2", "max_streams": 10}
+        try:
+            manager = config.build_manager(self.config)
+        except ImportError:
+            self.skipTest("httpx[http2] isn't installed")
+        transports = {id(watcher.transport) for watcher in manager.watchers}
+        self.assertEqual(len(transports), 1)
+        self.assertEqual(manager.watchers[0].transport.max_streams, 10)
+        manager.watchers[0].transport.close()
+
+    def test_file_alert(self):
+        """ Test that file alerts are appended to the file """
+        path = os.path.join(self.directory.name, "alerts.log")
+        alert = config.build_alert_function({"type": "file", "path": path})
+        alert("http://localhost/", "changed")
+        alert("http://localhost/", "changed again")
+        with open(path, encoding="utf-8") as alert_file:
+            self.assertEqual(alert_file.read().count("Change found on"), 2)
+
+    def test_load_json(self):
+        """ Test loading a JSON file """
+        path = self.write_file("config.json", json.dumps(self.config))
+        self.assertEqual(config.load_config(path), self.config)
+
+    def test_load_toml(self):
+        """ Test loading a TOML file """
+        path = self.write_file("config.toml",
+                               '[alert]\ntype = "print"\n'
+                               '[[watchers]]\nurl = "http://localhost/1"\n'
+                               '[watchers.comparator]\ntype = "tag"\n')
+        try:
+            loaded = config.load_config(path)
+        except ImportError:
+            self.skipTest("No TOML parser installed")
+        self.assertEqual(loaded["watchers"][0]["comparator"]["type"], "tag")
+
+    def test_load_yaml(self):
+        """ Test loading a YAML file """
+        path = self.write_file("config.yaml",
+                               "watchers:\n"
+                               "  - url: http://localhost/1\n"
+                               "    interval: 10\n")
+        try:
+            loaded = config.load_config(path)
+        except ImportError:
+            self.skipTest("PyYAML isn't installed")
+        self.assertEqual(loaded["watchers"][0]["interval"], 10)
+
+    def test_unknown_extension(self):
+        """ Test that unknown file types are an error """
+        with self.assertRaises(ValueError):
+            config.load_config(self.write_file("config.ini", ""))
+
+    def test_check_command(self):
+        """ Test that the command line can check a configuration """
+        path = self.write_file("config.json", json.dumps(self.config))
+        self.assertEqual(main([path, "--check"]), 0)
+
+    def test_check_command_errors(self):
+        """ Test that mistakes are reported by the
+            command line instead of raised """
+        self.config["watchers"][0]["interval"] = "60"
+        path = self.write_file("config.json", json.dumps(self.config))
+        with self.assertRaises(SystemExit) as context:
+            main([path, "--check"])
+        self.assertEqual(context.exception.code, 1)
+
+        with self.assertRaises(SystemExit) as context:
+            main([path, "--check", "--log-level", "loud"])
+        self.assertEqual(context.exception.code, 2)
+
+    def test_lazy_imports(self):
+        """ Test that BeautifulSoup isn't imported until it is needed """
+        code = ("import sys, http_page_monitor.config\n"
+                "print(any(name.startswith(('bs4', 'soupsieve'))"
+                " for name in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", code],
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "False")
@@ -0,0 +1,107 @@
+""" Tests the functions that build reports of textual differences """
+import unittest
+from .. import diffs
+
+
+def apply_script(old, new, script):
+    """ Applies an edit script to the old sequence """
+    result = []
+    position = 0
+    for kind, old_index, new_index in script:
+        result.extend(old[position:old_index])
+        position = old_index
+        if kind == "-":
+            position += 1
+        else:
+            result.append(new[new_index])
+    result.extend(old[position:])
+    return result
+
+
+class TestMyersDiff(unittest.TestCase):
+    """ Tests the edit script generation """
+    def test_equal_sequences(self):
+        """ Test that equal sequences need no edits """
+        self.assertEqual(diffs.myers_diff(list("abc"), list("abc")), [])
+
+    def test_shortest_script(self):
+        """ Test that the shortest script is found and can be applied """
+        old = list("abcabba")
+        new = list("cbabac")
+        script = diffs.myers_diff(old, new)
+        self.assertEqual(len(script), 5)
+        self.assertEqual(apply_script(old, new, script), new)
+
+    def test_insertion_and_deletion(self):
+        """ Test the positions of a single insertion and deletion """
+        self.assertEqual(diffs.myers_diff(list("ac"), list("abc")),
+                         [("+", 1, 1)])
+        self.assertEqual(diffs.myers_diff(list("abc"), list("ac")),
+                         [("-", 1, 1)])
+
+    def test_max_edits(self):
+        """ Test that the search gives up after max_edits """
+        self.assertEqual(diffs.myers_diff(list("abcd"), list("wxyz"), 3),
+                         None)
+
+
+class TestDiffReport(unittest.TestCase):
+    """ Tests the textual diff reports """
+    def setUp(self):
+        """ Create some long text to compare """
+        self.old = "\n".join("line{}".format(i) for i in range(1000))
+
+    def test_line_report(self):
+        """ Test that only the changed line and its context is reported """
+        new = self.old.replace("line500", "changed")
+        self.assertEqual(diffs.diff_report(self.old, new, context=1),
+                         "@@ -500,3 +500,3 @@\n"
+                         " line499\n"
+                         "-line500\n"
+                         "+changed\n"
+                         " line501")
+
+    def test_word_report(self):
+        """ Test a word level report """
+        self.assertEqual(diffs.diff_report("a b c d e", "a b x d e",
+                                           granularity="word", context=1),
+                         "@@ -2,3 +2,3 @@\n b\n-c\n+x\n d")
+
+    def test_separate_hunks(self):
+        """ Test that changes far apart are reported in separate hunks """
+        new = self.old.replace("line100\n", "").replace("line900", "changed")
+        report = diffs.diff_report(self.old, new)
+        self.assertEqual(report.count("@@ -"), 2)
+
+    def test_max_length(self):
+        """ Test that the report is cut off """
+        new = "\n".join("other{}".format(i) for i in range(1000))
+        for max_length in (5, 20, 100, 1000):
+            report = diffs.diff_report(self.old, new, max_length=max_length,
+                                       max_edits=None)
+            self.assertLessEqual(len(report), max_length)
+            self.assertIn("report truncated"[:max_length - 4], report)
+
+    def test_no_edits(self):
+        """ Test that there are no lines when only the spacing changed """
+        self.assertEqual(diffs.diff_lines("a b", "a  b", "word"), None)
+        self.assertEqual(diffs.diff_report("a b", "a  b", "word"), "")
+
+    def test_bounded_join(self):
+        """ Test that lines are dropped to make room for the marker """
+        lines = ["a" * 10] * 5
+        self.assertEqual(diffs.bounded_join(lines, 54), "\n".join(lines))
+        self.assertEqual(diffs.bounded_join(lines, 50),
+                         "a" * 10 + "\n... report truncated at 50 characters")
+        self.assertEqual(diffs.bounded_join(lines, 8), "... repo")
+
+    def test_max_edits(self):
+        """ Test that a rewritten text isn't diffed """
+        new = "\n".join("other{}".format(i) for i in range(1000))
+        self.assertEqual(diffs.diff_report(self.old, new, max_edits=10),
+                         "More than 10 lines changed (1000 -> 1000 lines)")
+
+    def test_unknown_granularity(self):
+        """ Test that an unknown granularity is an error """
+        with self.assertRaises(ValueError):
+            diffs.diff_report("a", "b", granularity="character")
@@ -2,10 +2,14 @@
     requests are being made and compared properly """
 import unittest
 import time
+from random import Random
+from threading import Event
 
 from http_page_monitor.tests.logging_http_server\
     import setup_logging_server
 from .. import watchers
+from ..clocks import VirtualClock
+from ..transports import FakeTransport, FakeResponse
 
 
 class TestPageWatcher(unittest.TestCase):
@@ -149,3 +153,166 @@ class TestPageWatcher(unittest.TestCase):
 
         # Assert that no alerts were made
         self.assertEqual(len(alerts), 0)
+
+    def check_probe_method(self, probe_method):
+        """ Make sure that a probe only leads to a full request
+            when the probed headers change """
+        page_w = watchers.PageWatcher(self.server.generate_address('/static'),
+                                      probe_method=probe_method)
+        # The first probe is taken with the first request
+        page_w.initial_request()
+        self.assertEqual(page_w.check_for_change(), None)
+        self.assertEqual(page_w.check_for_change(), None)
+        self.assertEqual(page_w.check_for_change(), None)
+        self.assertEqual(self.server.method_counts['GET'], 1)
+
+        self.server.static_version = 2
+        self.assertEqual(page_w.check_for_change(),
+                         "The requests are different")
+        self.assertEqual(self.server.method_counts['GET'], 2)
+
+    def test_head_probe(self):
+        """ Test the head probe method """
+        self.check_probe_method("head")
+        self.assertEqual(self.server.method_counts['HEAD'], 5)
+
+    def test_range_probe(self):
+        """ Test the ranged get probe method """
+        self.check_probe_method("range")
+        self.assertEqual(self.server.method_counts['GET range'], 5)
+
+    def test_probe_without_validators(self):
+        """ Test that a probe with only a Content-Length
+            doesn't stop the page from being fetched """
+        for probe_method in ("head", "range"):
+            self.server.reset_log()
+            page_w = watchers.PageWatcher(
+                self.server.generate_address('/static_length_only'),
+                probe_method=probe_method)
+            page_w.last_request = page_w.request_page()
+            self.assertEqual(page_w.probe_page(), None)
+
+            # A change of the same length is still found
+            self.server.static_version = 2
+            self.assertEqual(page_w.check_for_change(),
+                             "The requests are different")
+            self.assertEqual(page_w.check_for_change(), None)
+            self.assertEqual(self.server.method_counts['GET'], 3)
+
+    def test_probe_after_failed_request(self):
+        """ Test that a change seen by a probe is still reported
+            when the request for the changed page failed """
+        etag = ['"1"']
+        failing = Event()
+
+        def page(url):
+            return FakeResponse(etag[0].encode('utf-8'),
+                                headers={"ETag": etag[0]})
+        transport = FakeTransport({"http://fake/": page})
+        fake_get = transport.get
+
+        def get(url, **kwargs):
+            if failing.is_set():
+                raise ConnectionError("Connection refused")
+            return fake_get(url, **kwargs)
+        transport.get = get
+
+        page_w = watchers.PageWatcher("http://fake/", transport=transport,
+                                      probe_method="head")
+        page_w.initial_request()
+        self.assertEqual(page_w.check_for_change(), None)
+
+        etag[0] = '"2"'
+        failing.set()
+        self.assertEqual(page_w.check_for_change(), None)
+        failing.clear()
+        self.assertEqual(page_w.check_for_change(),
+                         "The requests are different")
+        self.assertEqual(page_w.check_for_change(), None)
+        self.assertEqual(
+            transport.requests_made.count(("GET", "http://fake/")), 2)
+
+    def test_unknown_probe(self):
+        """ Test that an unknown probe method is an error """
+        with self.assertRaises(ValueError):
+            watchers.PageWatcher(self.server.generate_address('/static'),
+                                 probe_method="options")
+
+
+class TestSimulation(unittest.TestCase):
+    """ Tests running PageWatchers against a virtual clock """
+    def setUp(self):
+        """ Set up a fake site with a page that changes on every request """
+        self.changes = 0
+
+        def changing_page(url):
+            self.changes += 1
+            return str(self.changes).encode('utf-8')
+
+        self.transport = FakeTransport({
+            "http://fake/static": b"Static",
+            "http://fake/changing": changing_page,
+        })
+
+    def build_manager(self, seed, alerts=None):
+        """ Build a manager watching the fake site many times """
+        clock = VirtualClock()
+        random_source = Random(seed)
+        page_watchers = []
+        for index in range(100):
+            url = "http://fake/changing" if index == 0 else "http://fake/static"
+            page_watchers.append(watchers.PageWatcher(
+                url, time_interval=60, clock=clock,
+                transport=self.transport, random_source=random_source))
+
+        def alert_function(url, info):
+            if alerts is not None:
+                alerts.append((clock.now(), url, info))
+
+        return watchers.WatcherManager(page_watchers,
+                                       alert_function=alert_function,
+                                       clock=clock)
+
+    def test_virtual_clock_wait(self):
+        """ Test that waiting moves the virtual clock forward """
+        clock = VirtualClock()
+        start = clock.now()
+        self.assertFalse(clock.wait(Event(), 30))
+        self.assertEqual((clock.now() - start).total_seconds(), 30)
+
+    def test_simulated_checks(self):
+        """ Test that an hour of checks runs and only the changing page alerts """
+        alerts = []
+        manager = self.build_manager(1, alerts)
+        start = manager.clock.now()
+        checks = manager.simulate(3600)
+
+        self.assertEqual((manager.clock.now() - start).total_seconds(), 3600)
+        # Every watcher checks about once a minute
+        self.assertGreater(checks, 100 * 50)
+        self.assertLess(checks, 100 * 70)
+        self.assertEqual(len(self.transport.requests_made), checks + 100)
+
+        self.assertEqual(self.changes, len(alerts) + 1)
+        self.assertTrue(all(url == "http://fake/changing"
+                            for _, url, _ in alerts))
+        times = [alert_time for alert_time, _, _ in alerts]
+        self.assertEqual(times, sorted(times))
+
+    def test_simulation_is_deterministic(self):
+        """ Test that the same seed gives the same schedule """
+        first = []
+        self.build_manager(7, first).simulate(3600)
+        second = []
+        self.build_manager(7, second).simulate(3600)
+        self.assertEqual(first, second)
+
+    def test_fake_head_request(self):
+        """ Test that fake head requests keep the headers """
+        transport = FakeTransport({"http://fake/": FakeResponse(
+            b"body", headers={"ETag": "1"})})
+        response = transport.head("http://fake/")
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["etag"], "1")
+        self.assertEqual(transport.get("http://fake/missing").status_code,
+                         404)
@@ -0,0 +1,161 @@
+""" Tests the tracing hooks and the comparison profiler """
+import unittest
+from unittest import mock
+from random import Random
+import cProfile
+import subprocess
+import sys
+from .. import tracing
+from .. import watchers
+from ..comparators import html_text_comparison, html_tag_comparison, \
+    html_fingerprint_comparison
+from ..transports import FakeTransport
+
+
+class TestTracing(unittest.TestCase):
+    """ Tests the phases that are traced """
+    def setUp(self):
+        """ Set up a watcher on a fake page that collects its spans """
+        self.spans = []
+        self.transport = FakeTransport({"http://fake/": b"<p>Page</p>"})
+
+    def trace_function(self, url, phase, duration):
+        """ Keep a span """
+        self.spans.append((url, phase, duration))
+
+    def test_traced(self):
+        """ Test that a with block is timed """
+        with tracing.traced(self.trace_function, "url", "phase"):
+            pass
+        self.assertEqual(len(self.spans), 1)
+        self.assertEqual(self.spans[0][:2], ("url", "phase"))
+        self.assertGreaterEqual(self.spans[0][2], 0)
+
+    def test_traced_without_function(self):
+        """ Test that nothing happens without a trace function """
+        with tracing.traced(None, "url", "phase"):
+            pass
+
+    def test_check_phases(self):
+        """ Test the phases of a check for change """
+        page_w = watchers.PageWatcher("http://fake/", transport=self.transport,
+                                      probe_method="head",
+                                      trace_function=self.trace_function)
+        page_w.last_request = page_w.request_page()
+        self.spans.clear()
+
+        page_w.check_for_change()
+        self.assertEqual([phase for _, phase, _ in self.spans],
+                         ["probe", "fetch", "download", "compare", "check"])
+
+    def test_alert_phases(self):
+        """ Test that the manager traces the alerts it sends """
+        manager = watchers.WatcherManager([], alert_function=lambda *_: None,
+                                          trace_function=self.trace_function)
+        manager.alert_wrapper("http://fake/", "changed")
+        self.assertEqual([phase for _, phase, _ in self.spans],
+                         ["alert_wait", "alert"])
+
+    def test_comparator_phases(self):
+        """ Test the phases of each comparison function """
+        for generator in (html_text_comparison, html_tag_comparison,
+                          html_fingerprint_comparison):
+            self.spans.clear()
+            compare = generator(trace_function=self.trace_function)
+            compare(b"<p>a</p>", b"<p>b</p>")
+            self.assertEqual({phase for _, phase, _ in self.spans},
+                             {"parse", "select", "diff"})
+            self.assertEqual({url for url, _, _ in self.spans}, {None})
+
+
+class TestComparatorProfiler(unittest.TestCase):
+    """ Tests the sampling comparison profiler """
+    def test_every_call_profiled(self):
+        """ Test that the stats of sampled calls are kept """
+        profiler = tracing.ComparatorProfiler(sample_rate=1)
+        compare = html_text_comparison()
+
+        self.assertEqual(profiler.call(compare, b"<p>a</p>", b"<p>a</p>"),
+                         None)
+        profiler.call(compare, b"<p>a</p>", b"<p>b</p>")
+
+        label = "{} at {:#x}".format(tracing.function_name(compare),
+                                     id(compare))
+        self.assertIn("html_text_comparison", label)
+        self.assertEqual(profiler.profiled_calls, {label: 2})
+        self.assertIn("2 profiled calls", profiler.report())
+
+    def test_generated_functions_kept_apart(self):
+        """ Test that the functions made by two calls of a generator
+            aren't combined unless they are given the same label """
+        profiler = tracing.ComparatorProfiler(sample_rate=1)
+        first = html_text_comparison("h1")
+        second = html_text_comparison("h2")
+        profiler.call(first, b"", b"")
+        profiler.call(second, b"", b"")
+        self.assertEqual(sorted(profiler.profiled_calls.values()), [1, 1])
+
+        profiler.call(first, b"", b"", label="headings")
+        profiler.call(second, b"", b"", label="headings")
+        self.assertEqual(profiler.profiled_calls["headings"], 2)
+
+    def test_one_profiler_at_a_time(self):
+        """ Test that calls aren't profiled while any
+            profiler is profiling another call """
+        profilers = [tracing.ComparatorProfiler(sample_rate=1)
+                     for _ in range(2)]
+
+        def compare(old, new):
+            return profilers[1].call(lambda *_: "changed", old, new)
+
+        self.assertEqual(profilers[0].call(compare, b"", b""), "changed")
+        self.assertEqual(sum(profilers[0].profiled_calls.values()), 1)
+        self.assertEqual(profilers[1].profiled_calls, {})
+
+    def test_other_profiler_active(self):
+        """ Test that the call is still made when another
+            profiling tool stops the profiler from starting """
+        profiler = tracing.ComparatorProfiler(sample_rate=1)
+        error = ValueError("Another profiling tool is already active")
+        with mock.patch.object(cProfile.Profile, "enable",
+                               side_effect=error):
+            self.assertEqual(profiler.call(lambda *_: "changed", b"", b""),
+                             "changed")
+        self.assertEqual(profiler.profiled_calls, {})
+        # The lock was given back
+        profiler.call(lambda *_: None, b"", b"")
+        self.assertEqual(sum(profiler.profiled_calls.values()), 1)
+
+    def test_lazy_imports(self):
+        """ Test that cProfile isn't imported until a call is profiled """
+        code = ("import sys, http_page_monitor.config\n"
+                "print(any(name in sys.modules"
+                " for name in ('cProfile', 'pstats')))")
+        output = subprocess.run([sys.executable, "-c", code],
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "False")
+
+    def test_sample_rate(self):
+        """ Test that only a fraction of the calls are profiled """
+        profiler = tracing.ComparatorProfiler(sample_rate=0.25,
+                                              random_source=Random(3))
+        for _ in range(400):
+            profiler.call(lambda old, new: None, b"", b"")
+        calls = sum(profiler.profiled_calls.values())
+        self.assertGreater(calls, 50)
+        self.assertLess(calls, 150)
+
+    def test_watcher_profiler(self):
+        """ Test that a watcher hands its comparisons to the profiler """
+        profiler = tracing.ComparatorProfiler(sample_rate=1)
+        page_w = watchers.PageWatcher(
+            "http://fake/", comparison_function=html_text_comparison(),
+            transport=FakeTransport({"http://fake/": b"<p>Page</p>"}),
+            comparison_profiler=profiler)
+        page_w.last_request = page_w.request_page()
+        page_w.check_for_change()
+        self.assertEqual(len(profiler.profiled_calls), 1)
+        label, calls = profiler.profiled_calls.popitem()
+        self.assertIn("html_text_comparison", label)
+        self.assertTrue(label.endswith(" on http://fake/"))
+        self.assertEqual(calls, 1)
@@ -0,0 +1,164 @@
+""" Tests the HTTP/2 transport against local servers """
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from http_page_monitor.tests.logging_http_server\
+    import setup_logging_server
+from .. import watchers
+
+try:
+    from http_page_monitor.tests.http2_server import setup_http2_server, \
+        server_ssl_context, client_ssl_context
+    from ..transports import HTTP2Transport
+    HTTP2Transport()
+    HAVE_HTTP2 = True
+except ImportError:
+    HAVE_HTTP2 = False
+
+
+@unittest.skipUnless(HAVE_HTTP2, "httpx[http2] isn't installed")
+class TestHTTP2Transport(unittest.TestCase):
+    """ Tests the HTTP/2 transport """
+    @classmethod
+    def setUpClass(cls):
+        cls.server = setup_http2_server()
+        cls.server.handle_requests()
+        cls.http1_server = setup_logging_server()
+        cls.http1_server.handle_requests()
+
+        # Servers that negotiate the protocol with ALPN over TLS
+        cls.tls_server = setup_http2_server(tls=True)
+        cls.tls_server.handle_requests()
+        cls.tls_http1_server = setup_logging_server()
+        cls.tls_http1_server.use_tls(server_ssl_context(["http/1.1"]))
+        cls.tls_http1_server.handle_requests()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.http1_server.shutdown()
+        cls.tls_server.shutdown()
+        cls.tls_http1_server.shutdown()
+
+    def setUp(self):
+        """ Reset the logs and make a fresh transport """
+        self.server.reset_log()
+        self.http1_server.reset_log()
+        self.tls_http1_server.reset_log()
+        self.transport = HTTP2Transport(max_streams=4, prior_knowledge=True)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_get(self):
+        """ Test a single request over HTTP/2 """
+        response = self.transport.get(self.server.generate_address('/page'))
+        self.assertEqual(response.http_version, "HTTP/2")
+        self.assertEqual(response.content, b"Response /page")
+        self.assertEqual(response.headers['ETag'], '"h2"')
+
+    def test_head(self):
+        """ Test that a head request has headers but no body """
+        response = self.transport.head(self.server.generate_address('/page'))
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers['Content-Length'], "14")
+
+    def test_multiplexed_requests(self):
+        """ Test that concurrent requests share a single connection """
+        urls = [self.server.generate_address('/{}'.format(index))
+                for index in range(40)]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            contents = list(executor.map(
+                lambda url: self.transport.get(url).content, urls))
+
+        self.assertEqual(contents, ["Response /{}".format(index)
+                                    .encode('utf-8') for index in range(40)])
+        self.assertEqual(self.server.request_count, 40)
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_stream_limit(self):
+        """ Test that no more than max_streams requests
+            are in flight at once """
+        url = self.server.generate_address('/slow')
+        with ThreadPoolExecutor(max_workers=12) as executor:
+            contents = list(executor.map(
+                lambda _: self.transport.get(url).content, range(12)))
+
+        self.assertEqual(contents, [b"Response /slow"] * 12)
+        self.assertEqual(self.server.most_in_flight, 4)
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_streams_given_back(self):
+        """ Test that streamed responses give their stream back """
+        url = self.server.generate_address('/page')
+        for _ in range(10):
+            self.transport.get(url, stream=True).close()
+        _, streams = self.transport.origin_for(url)
+        self.assertTrue(streams.acquire(blocking=False))
+        streams.release()
+
+    def test_dropped_streams_given_back(self):
+        """ Test that streamed responses dropped without
+            being read or closed give their stream back """
+        url = self.server.generate_address('/page')
+        for _ in range(4):
+            self.transport.get(url, stream=True)
+        _, streams = self.transport.origin_for(url)
+        for _ in range(4):
+            self.assertTrue(streams.acquire(blocking=False))
+        for _ in range(4):
+            streams.release()
+
+    def test_http1_fallback(self):
+        """ Test that a plain HTTP/1 server is still spoken to """
+        transport = HTTP2Transport()
+        try:
+            response = transport.get(self.http1_server.generate_address('/'))
+            self.assertNotEqual(response.http_version, "HTTP/2")
+            self.assertEqual(response.content, b"Response")
+        finally:
+            transport.close()
+
+    def test_alpn(self):
+        """ Test that HTTP/2 is picked with ALPN over TLS
+            and that HTTP/1.1 is used when it isn't offered """
+        transport = HTTP2Transport(verify=client_ssl_context())
+        try:
+            response = transport.get(self.tls_server.generate_address('/a'))
+            self.assertEqual(response.http_version, "HTTP/2")
+            self.assertEqual(response.content, b"Response /a")
+
+            response = transport.get(
+                self.tls_http1_server.generate_address('/'))
+            self.assertNotEqual(response.http_version, "HTTP/2")
+            self.assertEqual(response.content, b"Response")
+            self.assertEqual(self.tls_http1_server.request_count, 1)
+        finally:
+            transport.close()
+
+    def test_prior_knowledge_over_tls(self):
+        """ Test that prior knowledge doesn't stop https
+            origins from falling back to HTTP/1.1 """
+        transport = HTTP2Transport(prior_knowledge=True,
+                                   verify=client_ssl_context())
+        try:
+            response = transport.get(
+                self.tls_http1_server.generate_address('/'))
+            self.assertNotEqual(response.http_version, "HTTP/2")
+            self.assertEqual(response.content, b"Response")
+
+            response = transport.get(self.tls_server.generate_address('/a'))
+            self.assertEqual(response.http_version, "HTTP/2")
+        finally:
+            transport.close()
+
+    def test_page_watcher(self):
+        """ Test a page watcher using the HTTP/2 transport """
+        page_w = watchers.PageWatcher(self.server.generate_address('/'),
+                                      transport=self.transport,
+                                      probe_method="head")
+        page_w.last_request = page_w.request_page()
+        self.assertEqual(page_w.check_for_change(), None)
+        self.assertEqual(page_w.check_for_change(), None)
+        # The first check made a full request, the second only a probe
+        self.assertEqual(self.server.request_count, 4)
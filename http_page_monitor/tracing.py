@@ -0,0 +1,105 @@
+""" Hooks for timing the phases of a page check and
+    for profiling a sample of comparison function calls.
+    cProfile and pstats are only imported once a call is profiled
+    so that importing this module stays cheap """
+from contextlib import contextmanager
+from io import StringIO
+from threading import Lock
+from time import perf_counter
+import random
+
+
+@contextmanager
+def traced(trace_function, url, phase):
+    """ Times the body of a with block and then calls the trace
+        function with the url, the phase and the duration in seconds.
+        Does nothing if the trace function is None """
+    if trace_function is None:
+        yield
+        return
+
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        trace_function(url, phase, perf_counter() - start)
+
+
+def function_name(function):
+    """ Returns a name for a function that tells apart the
+        functions made by different comparison generators """
+    return "{}.{}".format(getattr(function, "__module__", None),
+                          getattr(function, "__qualname__", repr(function)))
+
+
+# Only one profiler can be running at a time in a process, from
+# Python 3.12 enabling a second one raises a ValueError.  Calls that
+# come in while another call is being profiled aren't sampled
+_profiling = Lock()
+
+
+class ComparatorProfiler:
+    """ Runs a fraction of comparison function calls under cProfile
+        and combines the stats of the calls for each function """
+    def __init__(self, sample_rate=0.01, random_source=None):
+        self.sample_rate = sample_rate
+        self.random_source = random if random_source is None \
+            else random_source
+
+        # Maps labels to their combined stats
+        self.stats = {}
+        self.profiled_calls = {}
+
+    def call(self, comparison_function, old_content, new_content,
+             label=None):
+        """ Call a comparison function, profiling it if it is sampled.
+            The stats are combined under the label, which defaults to
+            the name of the function and the id of the function so that
+            the functions made by each generator call are kept apart """
+        if self.random_source.random() >= self.sample_rate or \
+                not _profiling.acquire(blocking=False):
+            return comparison_function(old_content, new_content)
+
+        try:
+            import cProfile
+            import pstats
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiling tool, such as a debugger or a
+                # coverage tool, is already running
+                return comparison_function(old_content, new_content)
+            try:
+                result = comparison_function(old_content, new_content)
+            finally:
+                profile.disable()
+
+            if label is None:
+                label = "{} at {:#x}".format(function_name(
+                    comparison_function), id(comparison_function))
+            if label in self.stats:
+                self.stats[label].add(profile)
+            else:
+                self.stats[label] = pstats.Stats(profile)
+            self.profiled_calls[label] = self.profiled_calls.get(label, 0) + 1
+        finally:
+            _profiling.release()
+
+        return result
+
+    def report(self, sort_by="cumulative", limit=20):
+        """ Returns the combined stats of each
+            comparison function as a string """
+        import pstats
+
+        reports = []
+        for label, stats in self.stats.items():
+            stream = StringIO()
+            printer = pstats.Stats(stream=stream)
+            printer.add(stats)
+            printer.sort_stats(sort_by).print_stats(limit)
+            reports.append("{} ({} profiled calls)\n{}".format(
+                label, self.profiled_calls[label], stream.getvalue()))
+        return "\n".join(reports)
@@ -0,0 +1,195 @@
+""" Transports that PageWatchers can use to make requests.  Any object
+    with requests style get and head functions can be a transport,
+    by default the requests module itself is used """
+from threading import BoundedSemaphore, Lock
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class FakeResponse:
+    """ A response made up by a FakeTransport """
+    def __init__(self, content=b"", status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {})
+
+    @property
+    def ok(self):
+        """ True if the status code is not an error """
+        return self.status_code < 400
+
+    def close(self):
+        """ Nothing to release for a fake response """
+
+
+class FakeTransport:
+    """ A transport that answers requests from a dictionary of pages
+        without touching the network.  The pages are keyed by url and
+        are either bytes, a FakeResponse or a function that is given
+        the url and returns one of those.  Unknown urls get a 404 """
+    def __init__(self, pages=None):
+        self.pages = {} if pages is None else pages
+        self.requests_made = []
+
+    def response_for(self, url):
+        """ Returns the FakeResponse for a url """
+        page = self.pages.get(url)
+        if page is None:
+            return FakeResponse(status_code=404)
+        if callable(page):
+            page = page(url)
+        if isinstance(page, FakeResponse):
+            return page
+        return FakeResponse(page)
+
+    def get(self, url, **kwargs):
+        """ Make a fake GET request """
+        self.requests_made.append(("GET", url))
+        return self.response_for(url)
+
+    def head(self, url, **kwargs):
+        """ Make a fake HEAD request """
+        self.requests_made.append(("HEAD", url))
+        response = self.response_for(url)
+        return FakeResponse(status_code=response.status_code,
+                            headers=response.headers)
+
+
+class HTTP2Response:
+    """ A response from an HTTP2Transport.  Holds one of the origin's
+        streams until the body has been read, the response is closed
+        or the response is garbage collected """
+    def __init__(self, response, release, error_type):
+        self.response = response
+        # The httpx error raised while reading the body
+        self.error_type = error_type
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.http_version = response.http_version
+        self.release = release
+        self.released = False
+
+    @property
+    def ok(self):
+        """ True if the status code is not an error """
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        """ Reads the body of the response """
+        try:
+            return self.response.read()
+        except self.error_type as err:
+            raise requests.ConnectionError(str(err)) from err
+        finally:
+            self.close()
+
+    def close(self):
+        """ Close the response and give its stream back """
+        self.response.close()
+        if not self.released:
+            self.released = True
+            self.release()
+
+    def __del__(self):
+        # A response that is dropped without being read or
+        # closed still gives its stream back
+        if not getattr(self, "released", True):
+            self.close()
+
+
+class HTTP2Transport:
+    """ A transport that makes requests over HTTP/2 using httpx.  All
+        of the requests to an origin share one connection and at most
+        max_streams of them are in flight at once.  Origins that don't
+        offer HTTP/2 when the connection is made are spoken to over
+        HTTP/1.1 with up to http1_connections connections.  Plain http
+        urls only use HTTP/2 with prior_knowledge, since there is no
+        negotiation, and then can't fall back.  https urls always
+        negotiate.  verify is given to httpx
+        and can be an ssl.SSLContext to trust other certificates.
+        Needs httpx[http2] """
+    def __init__(self, max_streams=100, http1_connections=10,
+                 prior_knowledge=False, timeout=30, verify=True):
+        try:
+            import httpx
+            import h2  # noqa: F401
+        except ImportError:
+            raise ImportError("The HTTP/2 transport needs the "
+                              "httpx[http2] package") from None
+        self.httpx = httpx
+
+        self.max_streams = max_streams
+        self.http1_connections = http1_connections
+        self.prior_knowledge = prior_knowledge
+        self.timeout = timeout
+        self.verify = verify
+
+        # Maps origins to their (client, stream semaphore) pairs
+        self.origins = {}
+        self.origins_lock = Lock()
+
+    def origin_for(self, url):
+        """ Returns the client and stream semaphore for a url's origin """
+        parsed = self.httpx.URL(url)
+        origin = (parsed.scheme, parsed.host, parsed.port)
+        with self.origins_lock:
+            if origin not in self.origins:
+                # The connection pool puts every request on the HTTP/2
+                # connection once it is made, the extra connections are
+                # only used when the origin falls back to HTTP/1.1.
+                # Prior knowledge only means anything for plain http,
+                # https origins negotiate with ALPN and can fall back
+                client = self.httpx.Client(
+                    http1=not (self.prior_knowledge and
+                               parsed.scheme == "http"),
+                    http2=True,
+                    timeout=self.timeout,
+                    verify=self.verify,
+                    limits=self.httpx.Limits(
+                        max_connections=self.http1_connections,
+                        max_keepalive_connections=self.http1_connections))
+                self.origins[origin] = (client,
+                                        BoundedSemaphore(self.max_streams))
+            return self.origins[origin]
+
+    def request(self, method, url, headers=None, stream=False,
+                allow_redirects=True):
+        """ Make a request and return an HTTP2Response.  Unless streaming,
+            the body is read before returning.  httpx errors are raised
+            as the matching requests errors """
+        client, streams = self.origin_for(url)
+        streams.acquire()
+        try:
+            request = client.build_request(method, url, headers=headers)
+            response = client.send(request, stream=True,
+                                   follow_redirects=allow_redirects)
+        except self.httpx.TimeoutException as err:
+            streams.release()
+            raise requests.Timeout(str(err)) from err
+        except self.httpx.HTTPError as err:
+            streams.release()
+            raise requests.ConnectionError(str(err)) from err
+
+        response = HTTP2Response(response, streams.release,
+                                 self.httpx.HTTPError)
+        if not stream:
+            # Reading the content downloads the body
+            response.content
+        return response
+
+    def get(self, url, **kwargs):
+        """ Make a GET request """
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """ Make a HEAD request """
+        kwargs.setdefault("allow_redirects", False)
+        return self.request("HEAD", url, **kwargs)
+
+    def close(self):
+        """ Close the connections to every origin """
+        with self.origins_lock:
+            for client, _ in self.origins.values():
+                client.close()
+            self.origins.clear()
@@ -1,23 +1,44 @@
 """ This file allows the user to monitor pages for changes"""
-from datetime import datetime, timedelta
+from datetime import timedelta
 from threading import Thread, Event, Lock
-from random import normalvariate
+from heapq import heappush, heappop
 # from subprocess import run
 import logging
+import random
 import requests
+from .clocks import SystemClock
+from .tracing import traced, function_name
 # import page_comparators
 
+# The headers compared by a probe when no others are given
+DEFAULT_PROBE_HEADERS = ("ETag", "Last-Modified", "Content-Length")
+
 
 class PageWatcher (Thread):
     """ Watches a single page for changes """
     def __init__(self, url, time_interval=120,
                  comparison_function=None,
                  ignore_errors=True,
-                 alert_function=logging.info):
+                 alert_function=logging.info,
+                 probe_method=None,
+                 probe_headers=DEFAULT_PROBE_HEADERS,
+                 clock=None,
+                 transport=None,
+                 random_source=None,
+                 trace_function=None,
+                 comparison_profiler=None):
 
         super().__init__()
         self.url = url
 
+        # The clock tells the time and waits, the transport makes the
+        # requests and the random source adds jitter to the schedule.
+        # These can be replaced to simulate a watcher without waiting
+        self.clock = SystemClock() if clock is None else clock
+        self.transport = requests if transport is None else transport
+        self.random_source = random if random_source is None \
+            else random_source
+
         # A function to compare the content of two requests
         self.compare_content = comparison_function
         self.frequency = time_interval
@@ -36,8 +57,44 @@ class PageWatcher (Thread):
         # By default the alert function will just be a logger
         self.alert_function = alert_function
 
+        # A probe is a cheap "head" or "range" request whose headers are
+        # checked before fetching and comparing the whole page
+        if probe_method not in (None, "head", "range"):
+            raise ValueError("Unknown probe method: " + str(probe_method))
+        self.probe_method = probe_method
+        self.probe_headers = probe_headers
+        self.last_probe = None
+
+        # Called with the url, phase and duration of each phase of a
+        # check.  The profiler profiles a sample of the comparisons
+        self.trace_function = trace_function
+        self.comparison_profiler = comparison_profiler
+
     def run(self):
         """ Start this page watcher """
+        self.initial_request()
+
+        self.running = True
+        while self.running:
+            # If there is time to wait then wait and then execute
+            if self.current_sleep_time() > 0:
+                self.clock.wait(self.stop_alert, self.current_sleep_time())
+
+            # If the reason we exited the wait was because we stopped then stop
+            if self.stop_alert.isSet():
+                self.stop_alert.clear()
+                break
+
+            self.run_check()
+
+    def initial_request(self):
+        """ Make the first request for the page """
+        # Probe before fetching so that a change made in between is
+        # seen by the next probe, then the first check can skip the
+        # full request if nothing changed
+        if self.probe_method is not None:
+            self.last_probe = self.probe_page()
+
         # Print out the initial value of what is being
         # observed by comparing it to an empty document
         self.last_request = self.request_page()
@@ -54,21 +111,13 @@ class PageWatcher (Thread):
                          self.url,
                          self.last_request.content)
 
-        self.running = True
-        while self.running:
-            # If there is time to wait then wait and then execute
-            if self.current_sleep_time() > 0:
-                self.stop_alert.wait(timeout=self.current_sleep_time())
-
-            # If the reason we exited the wait was because we stopped then stop
-            if self.stop_alert.isSet():
-                self.stop_alert.clear()
-                break
-
-            result = self.check_for_change()
-            self.reset_next_run_time()
-            if result is not None:
-                self.alert_function(self.url, result)
+    def run_check(self):
+        """ Check for a change, schedule the next
+            check and send an alert if needed """
+        result = self.check_for_change()
+        self.reset_next_run_time()
+        if result is not None:
+            self.alert_function(self.url, result)
 
     def stop(self):
         """ Stop this page watcher """
@@ -78,28 +127,50 @@ class PageWatcher (Thread):
     def check_for_change(self):
         """ Fetch the page and compare it to
             the last time this page was fetched """
-        request = self.request_page()
-        diffs = self.compare_to_new_request(request)
-        self.last_request = request
-        return diffs
+        with traced(self.trace_function, self.url, "check"):
+            if self.probe_method is not None:
+                probe = self.probe_page()
+                # Skip the full request when none of the headers changed
+                if probe is not None and probe == self.last_probe:
+                    return None
+
+            request = self.request_page()
+            diffs = self.compare_to_new_request(request)
+            # A failed request gives back the last request.  The probe
+            # is only kept once the page it describes has been compared
+            # so a change isn't hidden by a failed request
+            if self.probe_method is not None and \
+                    request is not self.last_request:
+                self.last_probe = probe
+            self.last_request = request
+            return diffs
 
     def reset_next_run_time(self):
         """ Reset the next request to be based on
             the frequency plus some randomness """
         self.time_of_next_run =\
-            datetime.now() +\
-            timedelta(0, self.frequency + normalvariate(0, self.frequency / 4))
+            self.clock.now() +\
+            timedelta(0, self.frequency +
+                      self.random_source.normalvariate(0, self.frequency / 4))
 
     def request_page(self):
         """ Request the page that we are
             pointed to and return the data """
         logging.info('%s Requesting %s',
-                     str(datetime.now()),
+                     str(self.clock.now()),
                      self.url)
         try:
-            return requests.get(self.url,
-                                headers={'User-agent':
-                                         'page_monitor'})
+            # The fetch is the time until the headers are read and the
+            # download is the time it takes to read the body after that
+            with traced(self.trace_function, self.url, "fetch"):
+                response = self.transport.get(self.url,
+                                              headers={'User-agent':
+                                                       'page_monitor'},
+                                              stream=True)
+            with traced(self.trace_function, self.url, "download"):
+                # Reading the content downloads the body
+                response.content
+            return response
         except ConnectionError:
             logging.info('Error while trying to request: %s', self.url)
             if not self.ignore_errors:
@@ -107,34 +178,98 @@ class PageWatcher (Thread):
             # Return an exact copy of the last time so that this is ignored
             return self.last_request
 
+    def probe_page(self):
+        """ Request just the headers of the page and return the values
+            of the probe headers.  Returns None if the probe failed
+            or none of the headers other than Content-Length were sent """
+        logging.info('%s Probing %s',
+                     str(self.clock.now()),
+                     self.url)
+        try:
+            with traced(self.trace_function, self.url, "probe"):
+                if self.probe_method == "head":
+                    response = self.transport.head(
+                        self.url,
+                        headers={'User-agent': 'page_monitor'},
+                        allow_redirects=True)
+                else:
+                    response = self.transport.get(
+                        self.url,
+                        headers={'User-agent': 'page_monitor',
+                                 'Range': 'bytes=0-0'},
+                        stream=True)
+                    # Don't download the body if the range was ignored
+                    response.close()
+        except requests.RequestException:
+            logging.info('Error while trying to probe: %s', self.url)
+            return None
+
+        if response.status_code >= 400:
+            return None
+
+        probe = {}
+        for header in self.probe_headers:
+            value = response.headers.get(header)
+            # The length of a partial response is the length of the
+            # range so use the full length from the Content-Range
+            if header.lower() == "content-length" and \
+                    response.status_code == 206:
+                value = response.headers.get("Content-Range", "")\
+                    .rpartition("/")[2]
+                if value in ("", "*"):
+                    value = None
+            if value is not None:
+                probe[header.lower()] = value
+
+        # A change that keeps the length the same can't be seen in the
+        # length alone, so without another header the page is fetched
+        if not set(probe) - {"content-length"}:
+            return None
+        return probe
+
     def compare_to_new_request(self, new_request_data):
         """ Compare the new request data to the
             request that was previously made """
         # If we don't have a custom comparison function then just
         # check if the content is equal
-        if self.compare_content is None:
-            if new_request_data.content == self.last_request.content:
-                return None
-            return "The requests are different"
+        with traced(self.trace_function, self.url, "compare"):
+            if self.compare_content is None:
+                if new_request_data.content == self.last_request.content:
+                    return None
+                return "The requests are different"
+
+            if self.comparison_profiler is not None:
+                return self.comparison_profiler.call(
+                    self.compare_content,
+                    self.last_request.content,
+                    new_request_data.content,
+                    label="{} on {}".format(
+                        function_name(self.compare_content), self.url))
 
-        return self.compare_content(self.last_request.content,
-                                    new_request_data.content)
+            return self.compare_content(self.last_request.content,
+                                        new_request_data.content)
 
     def current_sleep_time(self, current_time=None):
         """ Returns the number of seconds until the request should be resent"""
-        current_time = datetime.now()
+        if current_time is None:
+            current_time = self.clock.now()
         return (self.time_of_next_run - current_time).total_seconds()
 
 
 class WatcherManager:
     """ Manages the running of several PageWatchers """
-    def __init__(self, page_watchers, alert_function=logging.info):
+    def __init__(self, page_watchers, alert_function=logging.info,
+                 clock=None, trace_function=None):
         if page_watchers is None:
             self.watchers = []
         else:
             self.watchers = page_watchers
 
         self.alert = alert_function
+        # The clock used when simulating the watchers
+        self.clock = SystemClock() if clock is None else clock
+        # Given to the watchers that don't have their own trace function
+        self.trace_function = trace_function
         self.alert_method_sync = Lock()
         self.running = False
 
@@ -147,14 +282,53 @@ class WatcherManager:
         self.running = True
         for watcher in self.watchers:
             watcher.alert_function = self.alert_wrapper
+            if watcher.trace_function is None:
+                watcher.trace_function = self.trace_function
             watcher.start()
 
+    def simulate(self, duration):
+        """ Run all the page watchers one after another in this thread
+            for duration seconds of the manager's clock.  Nothing waits,
+            the clock is moved forward to each check as it comes up, so
+            with a VirtualClock and a FakeTransport hours of checks can
+            be simulated in seconds.  The clock has to be one that can be
+            moved like a VirtualClock.  Returns the number of checks made """
+        end_time = self.clock.now() + timedelta(seconds=duration)
+
+        # Queue the watchers up by the time of their next check
+        queue = []
+        for index, watcher in enumerate(self.watchers):
+            watcher.clock = self.clock
+            watcher.alert_function = self.alert_wrapper
+            if watcher.trace_function is None:
+                watcher.trace_function = self.trace_function
+            watcher.initial_request()
+            watcher.reset_next_run_time()
+            heappush(queue, (watcher.time_of_next_run, index))
+
+        checks = 0
+        while queue and queue[0][0] <= end_time:
+            time_of_next_run, index = heappop(queue)
+            self.clock.advance_to(time_of_next_run)
+
+            watcher = self.watchers[index]
+            watcher.run_check()
+            checks += 1
+            heappush(queue, (watcher.time_of_next_run, index))
+
+        self.clock.advance_to(end_time)
+        return checks
+
     def alert_wrapper(self, url, data):
         """ Wraps the alert function so that is only called
             once even though multiple threads are using it """
-        self.alert_method_sync.acquire()
-        self.alert(url, data)
-        self.alert_method_sync.release()
+        with traced(self.trace_function, url, "alert_wait"):
+            self.alert_method_sync.acquire()
+        try:
+            with traced(self.trace_function, url, "alert"):
+                self.alert(url, data)
+        finally:
+            self.alert_method_sync.release()
 
     def stop(self):
         """ Stop all the page watchers """